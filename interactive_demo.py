@@ -6,7 +6,8 @@ Interactive Demo - Try Your Own Queries Live!
 import asyncio
 import sys
 import os
-from working_demo import SimpleQueryProcessor, SimpleExecutionEngine, SimpleLogger
+from collections.abc import Mapping
+from working_demo import SimpleQueryProcessor, SimpleExecutionEngine, count_rows
 
 def print_header():
     print("AI Function Calling Pipeline - Interactive Demo")
@@ -73,10 +74,10 @@ async def process_user_query(query):
             if 'datetime' in result:
                 dt = result['datetime']
                 print(f"      Time: {dt['formatted']} ({dt['weekday']})")
-            elif 'data' in result and isinstance(result['data'], list):
-                print(f"      Loaded {len(result['data'])} records")
-                if result['data']:
-                    print(f"      Columns: {list(result['data'][0].keys())}")
+            elif 'data' in result and isinstance(result['data'], Mapping):
+                print(f"      Loaded {count_rows(result['data'])} records")
+                if count_rows(result['data']):
+                    print(f"      Columns: {list(result['data'].keys())}")
             elif 'summary' in result:
                 summary = result['summary']
                 print(f"      Total: ${summary['sum']:.2f}")
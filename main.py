@@ -5,16 +5,22 @@ Main entry point for the AI Function Calling Pipeline
 
 import asyncio
 import sys
-from pathlib import Path
 
-# Add src to path
-sys.path.append(str(Path(__file__).parent / "src"))
+from project_codemate.pipeline.cli import main as cli_main
+
+
+def run(coro):
+    """Run a coroutine to completion, on uvloop where it is installed"""
+    try:
+        import uvloop
+    except ImportError:  # optional dependency; Windows keeps the default loop
+        return asyncio.run(coro)
+    return uvloop.run(coro)
 
-from pipeline.cli import main as cli_main
 
 if __name__ == "__main__":
     try:
-        asyncio.run(cli_main())
+        run(cli_main())
     except KeyboardInterrupt:
         print("\n👋 Goodbye!")
         sys.exit(0)
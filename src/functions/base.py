@@ -113,6 +113,8 @@ class FunctionRegistry:
     def __init__(self):
         self.functions: Dict[str, BaseFunction] = {}
         self.categories: Dict[str, List[str]] = {}
+        # Bumped on every registration so callers can tell when cached schemas are stale
+        self.version = 0
     
     def register(self, function: BaseFunction):
         """Register a function"""
@@ -121,6 +123,7 @@ class FunctionRegistry:
         if function.category not in self.categories:
             self.categories[function.category] = []
         self.categories[function.category].append(function.name)
+        self.version += 1
         
         logger.info(f"Registered function: {function.name} ({function.category})")
     
@@ -28,6 +28,7 @@ class ReadCSVFunction(BaseFunction):
     
     async def execute(self, file_path: str, delimiter: str = ",") -> Dict[str, Any]:
         try:
+            # pandas also accepts an open text stream (e.g. io.StringIO) here
             df = pd.read_csv(file_path, delimiter=delimiter)
             return {
                 "success": True,
@@ -6,10 +6,27 @@ This module implements function calling capabilities using the AI model.
 
 import json
 import re
+import threading
+from functools import lru_cache
 from typing import Dict, Any, List, Optional, Tuple
 from loguru import logger
 from .model_manager import ModelManager
 
+try:
+    from json_repair import repair_json
+except ImportError:  # optional dependency
+    repair_json = None
+
+
+# Keywords used by the fallback planner, tagged in a single scan of the query
+_FALLBACK_KEYWORDS_RE = re.compile(r'email|send|file|read|open|data|analyze|process')
+
+
+@lru_cache(maxsize=256)
+def _fallback_keywords(user_query: str) -> frozenset:
+    """Fallback planner keywords found in a query, memoized per query"""
+    return frozenset(_FALLBACK_KEYWORDS_RE.findall(user_query.lower()))
+
 
 class FunctionCallingModel:
     """AI model with function calling capabilities"""
@@ -17,6 +34,18 @@ class FunctionCallingModel:
     def __init__(self, model_manager: ModelManager):
         self.model_manager = model_manager
         self.system_prompt = self._create_system_prompt()
+        # Token ids and KV cache of the static prompt prefix (system prompt plus function
+        # list) for the last function catalog; only the per-query suffix is prefilled
+        self._primed_functions: Optional[List[Dict[str, Any]]] = None
+        self._primed_prefix: Optional[Tuple[Any, Any]] = None
+        # Planning runs on worker threads; priming happens once under the lock
+        self._primed_lock = threading.Lock()
+        # Index of the last function catalog seen by validate_function_calls
+        self._indexed_functions: Optional[List[Dict[str, Any]]] = None
+        self._function_index: Dict[str, List[str]] = {}
+        # Prompt descriptions of the last function catalog seen by plan_function_calls
+        self._described_functions: Optional[List[Dict[str, Any]]] = None
+        self._function_descriptions = ""
     
     def _create_system_prompt(self) -> str:
         """Create the system prompt for function calling"""
@@ -138,56 +167,112 @@ Response: {
     def plan_function_calls(self, user_query: str, available_functions: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Plan function calls based on user query"""
         try:
-            # Create function descriptions for the prompt
-            function_descriptions = self._create_function_descriptions(available_functions)
-            
-            # Create the full prompt
-            prompt = f"""{self.system_prompt}
-
-Available Functions:
-{function_descriptions}
-
-User Query: {user_query}
-
-Response (JSON only):"""
+            # Create the per-query part of the prompt
+            suffix = self._create_query_suffix(user_query)
+            primed_prefix = self._get_primed_prefix(available_functions)
             
             # Generate response
-            response = self.model_manager.generate_text(
-                prompt,
-                max_length=1024,
-                temperature=0.3  # Lower temperature for more consistent JSON
-            )
-            
-            # Parse the response
-            parsed_response = self._parse_response(response)
+            if primed_prefix is not None:
+                prefix_ids, prefix_cache = primed_prefix
+                response = self.model_manager.generate_from_ids(
+                    prefix_ids,
+                    suffix,
+                    max_length=1024,
+                    prefix_cache=prefix_cache,
+                    temperature=0.3  # Lower temperature for more consistent JSON
+                )
+            else:
+                response = self.model_manager.generate_text(
+                    self._create_prompt_prefix(available_functions) + suffix,
+                    max_length=1024,
+                    temperature=0.3
+                )
             
-            if parsed_response is None:
-                # Fallback: create a simple plan
-                return self._create_fallback_plan(user_query)
-            
-            return parsed_response
+            return self._plan_from_response(response, user_query)
             
         except Exception as e:
             logger.error(f"Error planning function calls: {e}")
             return self._create_fallback_plan(user_query)
     
-    def _create_function_descriptions(self, available_functions: List[Dict[str, Any]]) -> str:
-        """Create formatted function descriptions"""
-        descriptions = []
+    def plan_function_calls_batch(self, user_queries: List[str],
+                                  available_functions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Plan function calls for several queries with one batched model call"""
+        if not user_queries:
+            return []
         
-        for func in available_functions:
-            params = ", ".join([
-                f"{p['name']}: {p['type']}" 
-                for p in func.get('parameters', [])
-            ])
+        try:
+            # Every prompt starts with the same system prompt and function list
+            prefix = self._create_prompt_prefix(available_functions)
+            prompts = [prefix + self._create_query_suffix(user_query) for user_query in user_queries]
+            responses = self.model_manager.generate_text_batch(
+                prompts,
+                max_length=1024,
+                temperature=0.3
+            )
+            return [
+                self._plan_from_response(response, user_query)
+                for response, user_query in zip(responses, user_queries)
+            ]
             
-            desc = f"- {func['name']}({params}): {func['description']}"
-            descriptions.append(desc)
+        except Exception as e:
+            logger.error(f"Error planning batched function calls: {e}")
+            return [self._create_fallback_plan(user_query) for user_query in user_queries]
+    
+    def _create_prompt_prefix(self, available_functions: List[Dict[str, Any]]) -> str:
+        """Create the static part of the prompt shared by every query"""
+        return f"""{self.system_prompt}
+
+Available Functions:
+{self._create_function_descriptions(available_functions)}"""
+    
+    def _create_query_suffix(self, user_query: str) -> str:
+        """Create the per-query part of the prompt that follows the static prefix"""
+        return f"""
+
+User Query: {user_query}
+
+Response (JSON only):"""
+    
+    def _get_primed_prefix(self, available_functions: List[Dict[str, Any]]) -> Optional[Tuple[Any, Any]]:
+        """Get the prefix token ids and KV cache for this catalog, priming them once"""
+        with self._primed_lock:
+            if available_functions is not self._primed_functions:
+                self._primed_prefix = self.model_manager.prime_prefix(
+                    self._create_prompt_prefix(available_functions)
+                )
+                self._primed_functions = available_functions
+            return self._primed_prefix
+    
+    def _plan_from_response(self, response: str, user_query: str) -> Dict[str, Any]:
+        """Parse a model response into a plan, falling back to a keyword plan"""
+        parsed_response = self._parse_response(response)
+        
+        if parsed_response is None:
+            # Fallback: create a simple plan
+            return self._create_fallback_plan(user_query)
+        
+        return parsed_response
+    
+    def _create_function_descriptions(self, available_functions: List[Dict[str, Any]]) -> str:
+        """Create formatted function descriptions, cached per catalog"""
+        if available_functions is self._described_functions:
+            return self._function_descriptions
         
-        return "\n".join(descriptions)
+        # Sort by name so the prompt prefix is identical across requests (prefix caching)
+        self._function_descriptions = "\n".join(
+            "- {}({}): {}".format(
+                func['name'],
+                ", ".join(f"{p['name']}: {p['type']}" for p in func.get('parameters', ())),
+                func['description']
+            )
+            for func in sorted(available_functions, key=lambda f: f['name'])
+        )
+        self._described_functions = available_functions
+        return self._function_descriptions
     
     def _parse_response(self, response: str) -> Optional[Dict[str, Any]]:
         """Parse the AI model response to extract JSON"""
+        json_match = None
         try:
             # Try to find JSON in the response
             json_match = re.search(r'\{.*\}', response, re.DOTALL)
@@ -199,18 +284,44 @@ Response (JSON only):"""
             return json.loads(response)
             
         except json.JSONDecodeError as e:
+            # Truncated output may have an opening brace but no closing one
+            start = response.find('{')
+            if start != -1:
+                repaired = self._repair_json(json_str if json_match else response[start:])
+                if repaired is not None:
+                    return repaired
+            
             logger.warning(f"Failed to parse JSON response: {e}")
             logger.debug(f"Response was: {response}")
             return None
     
+    def _repair_json(self, json_str: str) -> Optional[Dict[str, Any]]:
+        """Repair slightly malformed JSON (trailing commas, unclosed braces, ...)"""
+        if repair_json is None:
+            return None
+        
+        try:
+            repaired = json.loads(repair_json(json_str))
+        except (json.JSONDecodeError, ValueError):
+            return None
+        
+        if isinstance(repaired, dict):
+            logger.debug("Repaired malformed JSON response")
+            return repaired
+        return None
+    
     def _create_fallback_plan(self, user_query: str) -> Dict[str, Any]:
-        """Create a fallback plan when AI parsing fails"""
-        # Simple keyword-based fallback
-        query_lower = user_query.lower()
+        """Create a fallback plan when AI parsing fails
+        
+        Fallback plans are marked "fallback" so they are not cached like model plans.
+        """
+        # Simple keyword-based fallback; the plan is built fresh since callers annotate it
+        hits = _fallback_keywords(user_query)
         
-        if "email" in query_lower and "send" in query_lower:
+        if {"email", "send"} <= hits:
             return {
                 "plan": "Send an email based on the user request",
+                "fallback": True,
                 "function_calls": [
                     {
                         "function_name": "send_email",
@@ -224,9 +335,10 @@ Response (JSON only):"""
                 ]
             }
         
-        elif "file" in query_lower and ("read" in query_lower or "open" in query_lower):
+        elif "file" in hits and hits & {"read", "open"}:
             return {
                 "plan": "Read a file as requested",
+                "fallback": True,
                 "function_calls": [
                     {
                         "function_name": "read_file",
@@ -238,9 +350,10 @@ Response (JSON only):"""
                 ]
             }
         
-        elif "data" in query_lower and ("analyze" in query_lower or "process" in query_lower):
+        elif "data" in hits and hits & {"analyze", "process"}:
             return {
                 "plan": "Analyze data as requested",
+                "fallback": True,
                 "function_calls": [
                     {
                         "function_name": "read_csv",
@@ -263,6 +376,7 @@ Response (JSON only):"""
         else:
             return {
                 "plan": "Get current system information",
+                "fallback": True,
                 "function_calls": [
                     {
                         "function_name": "get_system_info",
@@ -272,10 +386,20 @@ Response (JSON only):"""
                 ]
             }
     
+    def index_functions(self, available_functions: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+        """Map function names to their required parameter names, cached per catalog"""
+        if available_functions is not self._indexed_functions:
+            self._function_index = {
+                func['name']: [p['name'] for p in func.get('parameters', []) if p.get('required', True)]
+                for func in available_functions
+            }
+            self._indexed_functions = available_functions
+        return self._function_index
+    
     def validate_function_calls(self, function_calls: List[Dict[str, Any]], available_functions: List[Dict[str, Any]]) -> Tuple[bool, List[str]]:
         """Validate that the planned function calls are valid"""
         errors = []
-        available_function_names = {func['name'] for func in available_functions}
+        function_index = self.index_functions(available_functions)
         
         for i, call in enumerate(function_calls):
             # Check if function exists
@@ -284,7 +408,7 @@ Response (JSON only):"""
                 continue
             
             function_name = call['function_name']
-            if function_name not in available_function_names:
+            if function_name not in function_index:
                 errors.append(f"Function call {i+1}: Unknown function '{function_name}'")
                 continue
             
@@ -293,15 +417,13 @@ Response (JSON only):"""
                 errors.append(f"Function call {i+1}: Missing 'parameters'")
                 continue
             
-            # Find function definition
-            func_def = next((f for f in available_functions if f['name'] == function_name), None)
-            if func_def:
-                required_params = [p['name'] for p in func_def.get('parameters', []) if p.get('required', True)]
-                provided_params = set(call['parameters'].keys())
-                missing_params = set(required_params) - provided_params
-                
-                if missing_params:
-                    errors.append(f"Function call {i+1}: Missing required parameters: {', '.join(missing_params)}")
+            # Check required parameters
+            required_params = function_index[function_name]
+            provided_params = set(call['parameters'].keys())
+            missing_params = set(required_params) - provided_params
+            
+            if missing_params:
+                errors.append(f"Function call {i+1}: Missing required parameters: {', '.join(missing_params)}")
         
         return len(errors) == 0, errors
     
@@ -9,12 +9,20 @@ from transformers import (
     BitsAndBytesConfig,
     pipeline
 )
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 import yaml
 import os
+import copy
+import importlib.util
+import threading
 from loguru import logger
 
 
+# Files a prefetched snapshot needs: weights (safetensors or older .bin checkpoints),
+# configs, tokenizer files and the modules of trust_remote_code models
+_SNAPSHOT_PATTERNS = ["*.safetensors", "*.bin", "*.json", "*.py", "*.model", "*.txt", "tokenizer*"]
+
+
 class ModelManager:
     """Manages AI model loading and inference"""
     
@@ -24,6 +32,7 @@ class ModelManager:
         self.tokenizer = None
         self.pipeline = None
         self.device = self._get_device()
+        self.backend = self.config["model"].get("backend", "transformers")
         
     def _load_config(self, config_path: str) -> Dict[str, Any]:
         """Load configuration from YAML file"""
@@ -42,7 +51,8 @@ class ModelManager:
                 "device": "auto",
                 "max_length": 2048,
                 "temperature": 0.3,
-                "top_p": 0.9
+                "top_p": 0.9,
+                "backend": "transformers"
             },
             "alternative_models": [
                 "mistralai/Mistral-7B-Instruct-v0.2",
@@ -63,20 +73,40 @@ class ModelManager:
         else:
             return "cpu"
     
+    def _get_torch_dtype(self) -> torch.dtype:
+        """Pick the compute dtype: bf16 where supported, fp16 on other accelerators"""
+        if self.device == "cuda" and torch.cuda.is_bf16_supported():
+            return torch.bfloat16
+        if self.device != "cpu":
+            return torch.float16
+        return torch.float32
+    
+    def _get_attn_implementation(self) -> Optional[str]:
+        """FlashAttention-2 where the device and package support it, else None for the transformers default"""
+        if (self.device == "cuda"
+                and torch.cuda.get_device_capability()[0] >= 8
+                and importlib.util.find_spec("flash_attn") is not None):
+            return "flash_attention_2"
+        return None
+    
     def load_model(self, model_name: Optional[str] = None) -> bool:
         """Load the specified model"""
         if model_name is None:
             model_name = self.config["model"]["name"]
         
+        if self.backend == "vllm":
+            return self._load_vllm_model(model_name)
+        
         try:
             logger.info(f"Loading model: {model_name}")
+            torch_dtype = self._get_torch_dtype()
             
             # Configure quantization for large models if on GPU
             quantization_config = None
             if self.device == "cuda" and "7B" in model_name:
                 quantization_config = BitsAndBytesConfig(
                     load_in_4bit=True,
-                    bnb_4bit_compute_dtype=torch.float16,
+                    bnb_4bit_compute_dtype=torch_dtype,
                     bnb_4bit_use_double_quant=True,
                     bnb_4bit_quant_type="nf4"
                 )
@@ -95,9 +125,15 @@ class ModelManager:
             # Load model
             model_kwargs = {
                 "trust_remote_code": True,
-                "torch_dtype": torch.float16 if self.device != "cpu" else torch.float32,
+                "torch_dtype": torch_dtype,
             }
             
+            # Without FlashAttention-2 transformers picks the kernel, which also works for
+            # remote-code and older architectures that do not support SDPA
+            attn_implementation = self._get_attn_implementation()
+            if attn_implementation is not None:
+                model_kwargs["attn_implementation"] = attn_implementation
+            
             if quantization_config:
                 model_kwargs["quantization_config"] = quantization_config
                 model_kwargs["device_map"] = "auto"
@@ -115,7 +151,7 @@ class ModelManager:
                 model=self.model,
                 tokenizer=self.tokenizer,
                 device_map="auto" if quantization_config else self.device,
-                torch_dtype=torch.float16 if self.device != "cpu" else torch.float32,
+                torch_dtype=torch_dtype,
             )
             
             logger.info(f"Successfully loaded model: {model_name}")
@@ -125,20 +161,81 @@ class ModelManager:
             logger.error(f"Failed to load model {model_name}: {e}")
             return False
     
+    def _load_vllm_model(self, model_name: str) -> bool:
+        """Load a model through vLLM with automatic prefix caching"""
+        try:
+            from vllm import LLM
+            
+            logger.info(f"Loading model with vLLM: {model_name}")
+            
+            # Identical prompt prefixes (system prompt + function list) share KV blocks
+            self.model = LLM(
+                model=model_name,
+                trust_remote_code=True,
+                enable_prefix_caching=True
+            )
+            self.tokenizer = self.model.get_tokenizer()
+            
+            logger.info(f"Successfully loaded model: {model_name}")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Failed to load model {model_name} with vLLM: {e}")
+            return False
+    
+    def _prefetch_weights(self, model_name: str) -> Optional[threading.Thread]:
+        """Start downloading a model snapshot from the HF Hub in the background
+        
+        The download runs on a daemon thread, so one that turns out not to be
+        needed never holds up interpreter exit.
+        """
+        try:
+            from huggingface_hub import snapshot_download
+        except ImportError:
+            return None
+        
+        def download():
+            try:
+                snapshot_download(repo_id=model_name, allow_patterns=_SNAPSHOT_PATTERNS)
+            except Exception as e:
+                # Not on the Hub (e.g. a local path) - let load_model handle it
+                logger.debug(f"Prefetch failed for {model_name}: {e}")
+        
+        thread = threading.Thread(target=download, name=f"prefetch-{model_name}", daemon=True)
+        thread.start()
+        return thread
+    
     def try_load_models(self) -> bool:
         """Try loading models from the alternative list"""
-        models_to_try = [self.config["model"]["name"]] + self.config.get("alternative_models", [])
+        models_to_try = list(dict.fromkeys(
+            [self.config["model"]["name"]] + self.config.get("alternative_models", [])
+        ))
         
-        for model_name in models_to_try:
+        prefetches: Dict[str, threading.Thread] = {}
+        for i, model_name in enumerate(models_to_try):
+            prefetch = prefetches.pop(model_name, None)
+            if prefetch is not None:
+                prefetch.join()
+            
             logger.info(f"Attempting to load model: {model_name}")
             if self.load_model(model_name):
                 return True
+            
+            # Only once a candidate has failed, download the fallback after the next one
+            # while the next one loads, so the fallback chain does not download serially
+            if i + 2 < len(models_to_try):
+                prefetch = self._prefetch_weights(models_to_try[i + 2])
+                if prefetch is not None:
+                    prefetches[models_to_try[i + 2]] = prefetch
         
         logger.error("Failed to load any model")
         return False
     
     def generate_text(self, prompt: str, max_length: Optional[int] = None, **kwargs) -> str:
         """Generate text using the loaded model"""
+        if self.backend == "vllm":
+            return self._generate_text_vllm(prompt, max_length, **kwargs)
+        
         if self.pipeline is None:
             raise RuntimeError("No model loaded. Call load_model() first.")
         
@@ -166,6 +263,144 @@ class ModelManager:
             logger.error(f"Text generation failed: {e}")
             raise
     
+    def _generate_text_vllm(self, prompt: str, max_length: Optional[int] = None, **kwargs) -> str:
+        """Generate text through vLLM; shared prompt prefixes hit the prefix cache"""
+        if self.model is None:
+            raise RuntimeError("No model loaded. Call load_model() first.")
+        
+        from vllm import SamplingParams
+        
+        sampling_params = SamplingParams(
+            max_tokens=max_length or self.config["model"]["max_length"],
+            temperature=kwargs.get("temperature", self.config["model"]["temperature"]),
+            top_p=kwargs.get("top_p", self.config["model"]["top_p"])
+        )
+        
+        try:
+            outputs = self.model.generate([prompt], sampling_params, use_tqdm=False)
+            return outputs[0].outputs[0].text.strip()
+        except Exception as e:
+            logger.error(f"Text generation failed: {e}")
+            raise
+    
+    def generate_text_batch(self, prompts: List[str], max_length: Optional[int] = None, **kwargs) -> List[str]:
+        """Generate text for several prompts in one batched model call"""
+        if self.model is None or self.tokenizer is None:
+            raise RuntimeError("No model loaded. Call load_model() first.")
+        
+        max_length = max_length or self.config["model"]["max_length"]
+        temperature = kwargs.get("temperature", self.config["model"]["temperature"])
+        top_p = kwargs.get("top_p", self.config["model"]["top_p"])
+        
+        try:
+            if self.backend == "vllm":
+                from vllm import SamplingParams
+                
+                sampling_params = SamplingParams(max_tokens=max_length, temperature=temperature, top_p=top_p)
+                outputs = self.model.generate(prompts, sampling_params, use_tqdm=False)
+                return [output.outputs[0].text.strip() for output in outputs]
+            
+            # Decoder-only models continue from the right, so shorter prompts are padded on the
+            # left; passed per call because planning threads share the tokenizer
+            inputs = self.tokenizer(
+                prompts, return_tensors="pt", padding=True, padding_side="left"
+            ).to(self.model.device)
+            
+            with torch.inference_mode():
+                output_ids = self.model.generate(
+                    **inputs,
+                    max_length=max_length,
+                    temperature=temperature,
+                    top_p=top_p,
+                    do_sample=True,
+                    pad_token_id=self.tokenizer.pad_token_id,
+                    num_return_sequences=1
+                )
+            
+            # Decode only the newly generated tokens of each sequence
+            generated = self.tokenizer.batch_decode(
+                output_ids[:, inputs.input_ids.shape[-1]:],
+                skip_special_tokens=True
+            )
+            return [text.strip() for text in generated]
+            
+        except Exception as e:
+            logger.error(f"Batched text generation failed: {e}")
+            raise
+    
+    def encode_prefix(self, text: str) -> Optional[torch.Tensor]:
+        """Tokenize a static prompt prefix once so it can be reused across calls"""
+        # vLLM takes prompt strings and caches shared prefixes itself
+        if self.tokenizer is None or self.backend == "vllm":
+            return None
+        return self.tokenizer(text, return_tensors="pt").input_ids
+    
+    def prime_prefix(self, text: str) -> Optional[Tuple[torch.Tensor, Any]]:
+        """Run a static prompt prefix through the model once and keep its KV cache"""
+        prefix_ids = self.encode_prefix(text)
+        if prefix_ids is None or self.model is None:
+            return None
+        
+        try:
+            with torch.inference_mode():
+                outputs = self.model(input_ids=prefix_ids.to(self.model.device), use_cache=True)
+            return prefix_ids, outputs.past_key_values
+        except Exception as e:
+            logger.warning(f"Could not cache the prompt prefix, prefilling it per request: {e}")
+            return None
+    
+    def generate_from_ids(self, prefix_ids: torch.Tensor, suffix_text: str,
+                          max_length: Optional[int] = None, prefix_cache: Any = None, **kwargs) -> str:
+        """Generate text from pre-tokenized prefix ids followed by a text suffix
+        
+        prefix_cache is the KV cache from prime_prefix; with it only the suffix is prefilled.
+        """
+        if self.model is None or self.tokenizer is None:
+            raise RuntimeError("No model loaded. Call load_model() first.")
+        
+        max_length = max_length or self.config["model"]["max_length"]
+        temperature = kwargs.get("temperature", self.config["model"]["temperature"])
+        top_p = kwargs.get("top_p", self.config["model"]["top_p"])
+        
+        try:
+            # Only the per-request suffix is tokenized; the prefix ids are reused
+            suffix_ids = self.tokenizer(
+                suffix_text,
+                return_tensors="pt",
+                add_special_tokens=False
+            ).input_ids
+            input_ids = torch.cat([prefix_ids, suffix_ids], dim=-1).to(self.model.device)
+            attention_mask = torch.ones_like(input_ids)
+            
+            # generate extends the cache in place, so each request works on its own copy
+            cache_kwargs = {}
+            if prefix_cache is not None:
+                cache_kwargs["past_key_values"] = copy.deepcopy(prefix_cache)
+            
+            with torch.inference_mode():
+                output_ids = self.model.generate(
+                    input_ids=input_ids,
+                    attention_mask=attention_mask,
+                    **cache_kwargs,
+                    max_length=max_length,
+                    temperature=temperature,
+                    top_p=top_p,
+                    do_sample=True,
+                    pad_token_id=self.tokenizer.eos_token_id,
+                    num_return_sequences=1
+                )
+            
+            # Decode only the newly generated tokens
+            generated_text = self.tokenizer.decode(
+                output_ids[0, input_ids.shape[-1]:],
+                skip_special_tokens=True
+            )
+            return generated_text.strip()
+            
+        except Exception as e:
+            logger.error(f"Text generation failed: {e}")
+            raise
+    
     def is_loaded(self) -> bool:
         """Check if a model is loaded"""
         return self.model is not None and self.tokenizer is not None
@@ -175,9 +410,11 @@ class ModelManager:
         if not self.is_loaded():
             return {"loaded": False}
         
+        model_config = getattr(self.model, "config", None)
         return {
             "loaded": True,
-            "model_name": self.model.config.name_or_path if hasattr(self.model.config, 'name_or_path') else "unknown",
+            "model_name": getattr(model_config, "name_or_path", "unknown"),
+            "backend": self.backend,
             "device": self.device,
             "vocab_size": self.tokenizer.vocab_size,
             "max_length": self.config["model"]["max_length"]
@@ -6,6 +6,6 @@ Main pipeline for processing queries and executing function calls.
 
 from .query_processor import QueryProcessor
 from .execution_engine import ExecutionEngine
-from .pipeline_manager import PipelineManager
+from .pipeline_manager import PipelineManager, QueryResult
 
-__all__ = ['QueryProcessor', 'ExecutionEngine', 'PipelineManager']
+__all__ = ['QueryProcessor', 'ExecutionEngine', 'PipelineManager', 'QueryResult']
@@ -0,0 +1,101 @@
+"""
+Async Batcher
+
+Groups requests that arrive close together so they can be processed in one batch.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional, Set, Tuple
+from loguru import logger
+
+
+class AsyncBatcher:
+    """Collects submitted items into batches of up to max_batch_size
+    
+    A batch is dispatched once it is full, or max_latency_ms after its first
+    item arrived. process_batch receives the items in submission order and must
+    return one result per item; each submitter gets its own result back.
+    """
+    
+    def __init__(self, process_batch: Callable[[List[Any]], Awaitable[List[Any]]],
+                 max_batch_size: int = 8, max_latency_ms: float = 20.0):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_latency = max_latency_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # Batches being processed; referenced so their tasks are not garbage collected
+        self._dispatches: Set[asyncio.Task] = set()
+    
+    async def submit(self, item: Any) -> Any:
+        """Queue an item and wait for its result"""
+        # The worker is bound to the event loop that first submits to it
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._collect())
+        
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+    
+    async def _collect(self):
+        """Gather queued items into batches and dispatch each batch"""
+        loop = asyncio.get_running_loop()
+        
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_latency
+            
+            try:
+                while len(batch) < self.max_batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                for _, future in batch:
+                    future.cancel()
+                raise
+            
+            # Keep collecting the next batch while this one is processed
+            dispatch = asyncio.create_task(self._dispatch(batch))
+            self._dispatches.add(dispatch)
+            dispatch.add_done_callback(self._dispatches.discard)
+    
+    async def _dispatch(self, batch: List[Tuple[Any, asyncio.Future]]):
+        """Process one batch and hand each result to its submitter"""
+        items = [item for item, _ in batch]
+        
+        try:
+            results = await self.process_batch(items)
+            if len(results) != len(items):
+                raise RuntimeError(f"Batch returned {len(results)} results for {len(items)} items")
+        except Exception as e:
+            logger.error(f"Batch of {len(items)} items failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+    
+    async def close(self):
+        """Stop collecting; items still queued fail with CancelledError"""
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+        
+        if self._queue is not None:
+            while not self._queue.empty():
+                _, future = self._queue.get_nowait()
+                future.cancel()
+            self._queue = None
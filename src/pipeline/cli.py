@@ -3,21 +3,35 @@ Command Line Interface for the AI Function Calling Pipeline
 """
 
 import asyncio
+import concurrent.futures
+import inspect
 import json
 import sys
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Dict, List, Optional
 
 import typer
 from rich.console import Console
 from rich.table import Table
 from rich.panel import Panel
-from rich.progress import Progress, SpinnerColumn, TextColumn
-from rich.json import JSON
+from rich.progress import MofNCompleteColumn, Progress, SpinnerColumn, TextColumn
 from rich.prompt import Prompt, Confirm
 from loguru import logger
 
-from .pipeline_manager import PipelineManager
+from .pipeline_manager import DEFAULT_BATCH_CONCURRENCY, PipelineManager
+
+try:
+    from click.exceptions import ClickException
+except ImportError:  # newer typer releases bundle their own copy of click
+    from typer._click.exceptions import ClickException
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
 
 app = typer.Typer(help="AI Function Calling Pipeline CLI")
 console = Console()
@@ -25,76 +39,204 @@ console = Console()
 # Global pipeline manager
 pipeline_manager: Optional[PipelineManager] = None
 
+# Function catalog and search results for the current pipeline manager; the registry
+# is static after initialization, so these are invalidated only when the manager changes
+_functions_cache_owner: Optional[PipelineManager] = None
+_functions_cache: Optional[dict] = None
+_functions_by_category: Dict[str, List[dict]] = {}
+_search_cache: Dict[str, dict] = {}
+
+
+# Number of commands currently using the shared pipeline manager
+_pipeline_users = 0
+_pipeline_lock = asyncio.Lock()
+
+
+@asynccontextmanager
+async def _managed_pipeline():
+    """Yield an initialized pipeline manager, or None if initialization failed
+    
+    Nested uses in one process share a single manager, so the models are
+    loaded once; the manager is shut down when the last user exits.
+    """
+    global pipeline_manager, _pipeline_users
+    
+    async with _pipeline_lock:
+        if pipeline_manager is None or not pipeline_manager.initialized:
+            manager = PipelineManager()
+            
+            with Progress(
+                SpinnerColumn(),
+                TextColumn("[progress.description]{task.description}"),
+                console=console,
+                transient=True,
+            ) as progress:
+                progress.add_task("Initializing pipeline...", total=None)
+                success = await manager.initialize()
+            
+            if not success:
+                console.print("[red]Failed to initialize pipeline![/red]")
+                manager = None
+            pipeline_manager = manager
+        
+        if pipeline_manager is not None:
+            _pipeline_users += 1
+    
+    if pipeline_manager is None:
+        yield None
+        return
+    
+    try:
+        yield pipeline_manager
+    finally:
+        async with _pipeline_lock:
+            _pipeline_users -= 1
+            if _pipeline_users == 0 and pipeline_manager is not None:
+                await pipeline_manager.shutdown()
+
 
 @app.command()
 async def interactive():
     """Start interactive mode"""
-    global pipeline_manager
-    
     console.print(Panel.fit(
         "[bold blue]AI Function Calling Pipeline[/bold blue]\n"
         "Interactive Mode",
         border_style="blue"
     ))
     
-    # Initialize pipeline
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[progress.description]{task.description}"),
-        console=console,
-    ) as progress:
-        task = progress.add_task("Initializing pipeline...", total=None)
+    async with _managed_pipeline() as manager:
+        if manager is None:
+            return
         
-        pipeline_manager = PipelineManager()
-        success = await pipeline_manager.initialize()
+        console.print("[green]Pipeline initialized successfully![/green]")
         
-        if not success:
-            console.print("[red]Failed to initialize pipeline![/red]")
-            return
+        # Show available commands
+        show_help()
+        
+        # Input is read on a daemon thread and handled by the consumer on the event loop,
+        # so piped queries are read ahead while the previous one is still being planned,
+        # and exiting never waits on a thread blocked in input()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=2)
+        ready = threading.Event()
+        ready.set()
+        
+        reader = threading.Thread(
+            target=_read_input,
+            args=(asyncio.get_running_loop(), queue, ready, Prompt),
+            name="interactive-input",
+            daemon=True,
+        )
+        reader.start()
+        
+        try:
+            await _input_consumer(queue, ready)
+        except KeyboardInterrupt:
+            pass
+        except asyncio.CancelledError:
+            # Ctrl+C under asyncio.run cancels this task rather than raising
+            # KeyboardInterrupt here; shut the pipeline down and let it finish
+            console.print("\n[yellow]Goodbye![/yellow]")
+            raise
     
-    console.print("[green]Pipeline initialized successfully![/green]")
+    console.print("\n[yellow]Goodbye![/yellow]")
+
+
+# Queued by the input producer when the user quits or input ends
+_END_OF_INPUT = None
+
+
+class _PipedStdin:
+    """Piped stdin read through a file object of its own, raising EOFError at the end like input()
     
-    # Show available commands
-    console.print("\n[bold]Available commands:[/bold]")
-    console.print("• Type your query to process it")
-    console.print("• 'functions' - List available functions")
-    console.print("• 'search <keyword>' - Search functions")
-    console.print("• 'history' - Show execution history")
-    console.print("• 'status' - Show pipeline status")
-    console.print("• 'help' - Show this help")
-    console.print("• 'quit' or 'exit' - Exit the program")
+    A daemon thread blocked reading sys.stdin holds its buffer lock, which aborts
+    interpreter shutdown; this file object is not touched at shutdown.
+    """
+    
+    def __init__(self):
+        self._file = open(sys.stdin.fileno(), closefd=False)
+    
+    def readline(self) -> str:
+        line = self._file.readline()
+        if not line:
+            raise EOFError
+        return line
+
+
+def _read_input(loop: asyncio.AbstractEventLoop, queue: asyncio.Queue,
+                ready: threading.Event, prompt) -> None:
+    """Read interactive input and queue it for the consumer; runs on a daemon thread
+    
+    On a terminal the next prompt waits until the previous entry has been handled,
+    so output is never interleaved with typing; piped input is read ahead.
+    """
+    wait_for_consumer = sys.stdin.isatty()
+    # A terminal is read by input() itself, which keeps line editing
+    stream = None if wait_for_consumer else _PipedStdin()
+    
+    def put(entry) -> bool:
+        """Queue an entry on the event loop; False once the loop has stopped"""
+        try:
+            asyncio.run_coroutine_threadsafe(queue.put(entry), loop).result()
+            return True
+        except (RuntimeError, concurrent.futures.CancelledError):
+            return False
     
-    # Interactive loop
     while True:
+        if wait_for_consumer:
+            ready.wait()
+            ready.clear()
+        
         try:
-            user_input = Prompt.ask("\n[bold cyan]Query[/bold cyan]").strip()
+            user_input = prompt.ask("\n[bold cyan]Query[/bold cyan]", stream=stream).strip()
+            command = user_input.lower()
             
-            if user_input.lower() in ['quit', 'exit', 'q']:
+            if command in _QUIT_COMMANDS:
                 break
-            elif user_input.lower() == 'help':
-                show_help()
-            elif user_input.lower() == 'functions':
-                await show_functions()
-            elif user_input.lower().startswith('search '):
-                keyword = user_input[7:].strip()
-                await search_functions(keyword)
-            elif user_input.lower() == 'history':
-                await show_history()
-            elif user_input.lower() == 'status':
-                await show_status()
-            elif user_input:
-                await process_query_interactive(user_input)
             
-        except KeyboardInterrupt:
+            # Queries need their execute/simulate answers before they can be queued
+            options = None
+            if user_input and command not in _INTERACTIVE_COMMANDS and not command.startswith('search '):
+                execute = Confirm.ask("Execute the plan?", default=True, stream=stream)
+                simulate = Confirm.ask("Simulate execution?", default=False, stream=stream) if execute else False
+                options = (execute, simulate)
+            
+            if not put((user_input, options)):
+                return
+        except EOFError:
             break
         except Exception as e:
             console.print(f"[red]Error: {e}[/red]")
+            ready.set()
     
-    # Cleanup
-    if pipeline_manager:
-        await pipeline_manager.shutdown()
-    
-    console.print("\n[yellow]Goodbye![/yellow]")
+    put(_END_OF_INPUT)
+
+
+async def _input_consumer(queue: asyncio.Queue, ready: threading.Event) -> None:
+    """Handle queued interactive input until the producer signals the end"""
+    while True:
+        entry = await queue.get()
+        if entry is _END_OF_INPUT:
+            break
+        
+        user_input, options = entry
+        try:
+            command = user_input.lower()
+            handler = _INTERACTIVE_COMMANDS.get(command)
+            
+            if handler is not None:
+                outcome = handler()
+                if asyncio.iscoroutine(outcome):
+                    await outcome
+            elif command.startswith('search '):
+                keyword = user_input[7:].strip()
+                await search_functions(keyword)
+            elif user_input:
+                execute, simulate = options
+                await process_query_interactive(user_input, execute=execute, simulate=simulate)
+        except Exception as e:
+            console.print(f"[red]Error: {e}[/red]")
+        finally:
+            ready.set()
 
 
 @app.command()
@@ -105,97 +247,84 @@ async def query(
     output_file: Optional[str] = typer.Option(None, "--output", help="Save result to file")
 ):
     """Process a single query"""
-    global pipeline_manager
-    
     console.print(f"[bold]Processing query:[/bold] {text}")
     
-    # Initialize pipeline
-    pipeline_manager = PipelineManager()
-    
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[progress.description]{task.description}"),
-        console=console,
-    ) as progress:
-        task = progress.add_task("Initializing pipeline...", total=None)
-        success = await pipeline_manager.initialize()
-        
-        if not success:
-            console.print("[red]Failed to initialize pipeline![/red]")
+    async with _managed_pipeline() as manager:
+        if manager is None:
             return
         
-        progress.update(task, description="Processing query...")
-        result = await pipeline_manager.process_query(text, execute=execute, simulate=simulate)
-    
-    # Display result
-    display_result(result)
-    
-    # Save to file if requested
-    if output_file:
-        save_result_to_file(result, output_file)
-    
-    # Cleanup
-    await pipeline_manager.shutdown()
+        with Progress(
+            SpinnerColumn(),
+            TextColumn("[progress.description]{task.description}"),
+            console=console,
+        ) as progress:
+            progress.add_task("Processing query...", total=None)
+            result = await manager.process_query(text, execute=execute, simulate=simulate)
+        
+        # Display result
+        display_result(result)
+        
+        # Save to file if requested
+        if output_file:
+            save_result_to_file(result, output_file)
 
 
 @app.command()
 async def batch(
     file_path: str = typer.Argument(..., help="Path to file containing queries (one per line)"),
     execute: bool = typer.Option(True, "--execute/--no-execute", help="Execute the plans"),
-    output_file: Optional[str] = typer.Option(None, "--output", help="Save results to file")
+    output_file: Optional[str] = typer.Option(None, "--output", help="Save results to file"),
+    concurrency: int = typer.Option(DEFAULT_BATCH_CONCURRENCY, "--concurrency",
+                                    help="Maximum number of queries processed at once")
 ):
     """Process multiple queries from a file"""
-    global pipeline_manager
-    
     # Read queries from file
     try:
-        with open(file_path, 'r') as f:
-            queries = [line.strip() for line in f if line.strip()]
+        # One bulk read and a C-level splitlines instead of iterating the file object
+        lines = Path(file_path).read_text().splitlines()
+        queries = [line.strip() for line in lines if line.strip()]
     except Exception as e:
         console.print(f"[red]Error reading file: {e}[/red]")
         return
     
     console.print(f"[bold]Processing {len(queries)} queries from {file_path}[/bold]")
     
-    # Initialize pipeline
-    pipeline_manager = PipelineManager()
-    
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[progress.description]{task.description}"),
-        console=console,
-    ) as progress:
-        init_task = progress.add_task("Initializing pipeline...", total=None)
-        success = await pipeline_manager.initialize()
-        
-        if not success:
-            console.print("[red]Failed to initialize pipeline![/red]")
+    async with _managed_pipeline() as manager:
+        if manager is None:
             return
         
-        progress.remove_task(init_task)
-        batch_task = progress.add_task("Processing queries...", total=len(queries))
+        with Progress(
+            SpinnerColumn(),
+            TextColumn("[progress.description]{task.description}"),
+            MofNCompleteColumn(),
+            console=console,
+        ) as progress:
+            batch_task = progress.add_task("Processing queries...", total=len(queries))
+            
+            # Tick the progress bar as each query finishes; results keep input order
+            batch_results = [None] * len(queries)
+            async for i, query_result in manager.iter_batch_queries(
+                queries, execute=execute, max_concurrency=concurrency
+            ):
+                batch_results[i] = query_result
+                progress.update(batch_task, advance=1)
+            result = manager.build_batch_result(batch_results)
+        
+        # Display summary
+        summary = result.get('summary', {})
+        console.print(f"\n[bold]Batch Processing Summary:[/bold]")
+        console.print(f"Total queries: {summary.get('total_queries', 0)}")
+        console.print(f"Successful: {summary.get('successful', 0)}")
+        console.print(f"Failed: {summary.get('failed', 0)}")
+        console.print(f"Success rate: {summary.get('success_rate', 0):.1%}")
         
-        result = await pipeline_manager.process_batch_queries(queries, execute=execute)
-        progress.update(batch_task, completed=len(queries))
-    
-    # Display summary
-    summary = result.get('summary', {})
-    console.print(f"\n[bold]Batch Processing Summary:[/bold]")
-    console.print(f"Total queries: {summary.get('total_queries', 0)}")
-    console.print(f"Successful: {summary.get('successful', 0)}")
-    console.print(f"Failed: {summary.get('failed', 0)}")
-    console.print(f"Success rate: {summary.get('success_rate', 0):.1%}")
-    
-    # Save to file if requested
-    if output_file:
-        save_result_to_file(result, output_file)
-    
-    # Cleanup
-    await pipeline_manager.shutdown()
+        # Save to file if requested
+        if output_file:
+            save_result_to_file(result, output_file)
 
 
-async def process_query_interactive(query: str):
-    """Process a query in interactive mode"""
+async def process_query_interactive(query: str, execute: Optional[bool] = None, simulate: Optional[bool] = None):
+    """Process a query in interactive mode, asking for any preferences not given"""
     global pipeline_manager
     
     if not pipeline_manager:
@@ -203,10 +332,10 @@ async def process_query_interactive(query: str):
         return
     
     # Ask user preferences
-    execute = Confirm.ask("Execute the plan?", default=True)
-    simulate = False
-    if execute:
-        simulate = Confirm.ask("Simulate execution?", default=False)
+    if execute is None:
+        execute = Confirm.ask("Execute the plan?", default=True)
+    if simulate is None:
+        simulate = Confirm.ask("Simulate execution?", default=False) if execute else False
     
     with Progress(
         SpinnerColumn(),
@@ -234,17 +363,20 @@ def display_result(result: dict):
     
     function_calls = plan.get('function_calls', [])
     if function_calls:
+        # Build the row tuples up front; rich has no bulk add, so rows are added in one tight loop
+        rows = [
+            (str(i + 1), call.get('function_name', 'Unknown'), call.get('description', 'No description'))
+            for i, call in enumerate(function_calls)
+        ]
+        
         table = Table(title="Function Calls")
         table.add_column("Step", style="cyan")
         table.add_column("Function", style="magenta")
         table.add_column("Description", style="green")
         
-        for i, call in enumerate(function_calls):
-            table.add_row(
-                str(i + 1),
-                call.get('function_name', 'Unknown'),
-                call.get('description', 'No description')
-            )
+        add_row = table.add_row
+        for row in rows:
+            add_row(*row)
         
         console.print(table)
     
@@ -258,6 +390,37 @@ def display_result(result: dict):
         console.print(f"Failed: {summary.get('failed_functions', 0)}")
 
 
+def _reset_functions_cache_if_stale():
+    """Drop cached function info when the global pipeline manager has changed"""
+    global _functions_cache_owner, _functions_cache, _functions_by_category
+    
+    if _functions_cache_owner is not pipeline_manager:
+        _functions_cache_owner = pipeline_manager
+        _functions_cache = None
+        _functions_by_category = {}
+        _search_cache.clear()
+
+
+def _get_functions_info() -> dict:
+    """Get (cached) available function info, indexed by category"""
+    global _functions_cache, _functions_by_category
+    
+    _reset_functions_cache_if_stale()
+    if _functions_cache is None:
+        functions_info = pipeline_manager.get_available_functions()
+        if 'error' in functions_info:
+            return functions_info
+        
+        by_category = defaultdict(list)
+        for func in functions_info.get('functions', []):
+            by_category[func.get('category')].append(func)
+        
+        _functions_cache = functions_info
+        _functions_by_category = dict(by_category)
+    
+    return _functions_cache
+
+
 async def show_functions():
     """Show available functions"""
     global pipeline_manager
@@ -266,7 +429,7 @@ async def show_functions():
         console.print("[red]Pipeline not initialized![/red]")
         return
     
-    functions_info = pipeline_manager.get_available_functions()
+    functions_info = _get_functions_info()
     
     console.print(f"\n[bold]Available Functions ({functions_info.get('total_functions', 0)}):[/bold]")
     
@@ -274,12 +437,7 @@ async def show_functions():
     for category in categories:
         console.print(f"\n[bold cyan]{category.title()}:[/bold cyan]")
         
-        category_functions = [
-            f for f in functions_info.get('functions', [])
-            if f.get('category') == category
-        ]
-        
-        for func in category_functions:
+        for func in _functions_by_category.get(category, []):
             console.print(f"  • {func.get('name', 'Unknown')}: {func.get('description', 'No description')}")
 
 
@@ -291,7 +449,12 @@ async def search_functions(keyword: str):
         console.print("[red]Pipeline not initialized![/red]")
         return
     
-    search_result = pipeline_manager.search_functions(keyword)
+    _reset_functions_cache_if_stale()
+    search_result = _search_cache.get(keyword)
+    if search_result is None:
+        search_result = pipeline_manager.search_functions(keyword)
+        if 'error' not in search_result:
+            _search_cache[keyword] = search_result
     functions = search_result.get('functions', [])
     
     console.print(f"\n[bold]Search results for '{keyword}' ({len(functions)} found):[/bold]")
@@ -356,11 +519,35 @@ def show_help():
     console.print("• 'quit' or 'exit' - Exit the program")
 
 
+# Interactive commands that take no argument; 'search <keyword>' is matched separately
+_INTERACTIVE_COMMANDS: Dict[str, Callable] = {
+    'help': show_help,
+    'functions': show_functions,
+    'history': show_history,
+    'status': show_status,
+}
+_QUIT_COMMANDS = frozenset({'quit', 'exit', 'q'})
+
+
+def _json_default(obj):
+    """Serialize objects json cannot: query results by their fields, anything else as str"""
+    to_dict = getattr(obj, "to_dict", None)
+    return to_dict() if callable(to_dict) else str(obj)
+
+
 def save_result_to_file(result: dict, file_path: str):
     """Save result to file"""
     try:
-        with open(file_path, 'w') as f:
-            json.dump(result, f, indent=2, default=str)
+        if orjson is not None:
+            with open(file_path, 'wb') as f:
+                f.write(orjson.dumps(
+                    result,
+                    default=str,
+                    option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+                ))
+        else:
+            with open(file_path, 'w') as f:
+                json.dump(result, f, indent=2, default=_json_default)
         console.print(f"[green]Result saved to {file_path}[/green]")
     except Exception as e:
         console.print(f"[red]Error saving file: {e}[/red]")
@@ -377,8 +564,15 @@ async def main():
         level="INFO"
     )
     
-    # Run the CLI app
-    await app()
+    # Typer calls the async commands without awaiting them; outside standalone mode
+    # it returns the command's coroutine, which is awaited here on the running loop
+    try:
+        result = app(standalone_mode=False)
+    except ClickException as e:
+        e.show()
+        sys.exit(e.exit_code)
+    if inspect.isawaitable(result):
+        await result
 
 
 if __name__ == "__main__":
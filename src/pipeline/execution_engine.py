@@ -6,21 +6,48 @@ Executes function call sequences and manages input/output mapping.
 
 import asyncio
 import json
-from typing import Dict, Any, List, Optional, Union
+import re
+from collections import deque
+from itertools import islice
+from typing import Dict, Any, List, Optional, Tuple, Union
 from loguru import logger
 from ..functions import registry
+from .utils import get_timestamp
+
+
+# {{...}} references inside parameter values, and explicit result_<index> targets
+_REFERENCE_RE = re.compile(r'\{\{\s*(.+?)\s*\}\}', re.DOTALL)
+_RESULT_INDEX_RE = re.compile(r'result_(\d+)')
+
+# Data loading functions; a failure here stops the rest of the plan
+_CRITICAL_FUNCTIONS = frozenset({
+    'read_csv', 'read_file', 'read_json', 'read_excel',
+    'query_database', 'fetch_web_page'
+})
 
 
 class ExecutionEngine:
     """Executes function call sequences with proper input/output mapping"""
     
-    def __init__(self):
+    def __init__(self, parallel_execution: bool = False, history_limit: int = 500):
         self.function_registry = registry
+        # Run calls without data dependencies on each other concurrently
+        self.parallel_execution = parallel_execution
         self.execution_context = {}
-        self.results_history = []
+        # Only the most recent history_limit executions are kept
+        self.results_history = deque(maxlen=history_limit)
+        # Dotted references ("result_0.data.field") split into their key paths
+        self._ref_path_cache: Dict[str, Tuple[str, ...]] = {}
+        # execution_context is per-engine, so concurrent plans take turns executing
+        self._execution_lock = asyncio.Lock()
     
     async def execute_plan(self, plan: Dict[str, Any]) -> Dict[str, Any]:
         """Execute a complete function call plan"""
+        async with self._execution_lock:
+            return await self._execute_plan(plan)
+    
+    async def _execute_plan(self, plan: Dict[str, Any]) -> Dict[str, Any]:
+        """Execute a plan while holding the execution lock"""
         try:
             logger.info(f"Executing plan: {plan.get('plan', 'Unknown plan')}")
             
@@ -32,26 +59,44 @@ class ExecutionEngine:
             
             results = []
             self.execution_context = {}
+            templates = self._compile_plan(function_calls)
+            functions = self._resolve_functions(function_calls)
+            
+            if self.parallel_execution:
+                levels = self._build_dag(function_calls)
+            else:
+                levels = [[i] for i in range(len(function_calls))]
             
-            for i, call in enumerate(function_calls):
-                logger.info(f"Executing function {i+1}/{len(function_calls)}: {call.get('function_name', 'unknown')}")
+            for level in levels:
+                for i in level:
+                    logger.info(f"Executing function {i+1}/{len(function_calls)}: {function_calls[i].get('function_name', 'unknown')}")
                 
-                result = await self._execute_single_function(call, i)
-                results.append(result)
+                if len(level) == 1:
+                    i = level[0]
+                    level_results = [await self._execute_single_function(function_calls[i], i, templates[i], functions)]
+                else:
+                    level_results = await asyncio.gather(
+                        *(self._execute_single_function(function_calls[i], i, templates[i], functions) for i in level)
+                    )
                 
-                # Store result in context for future function calls
-                self.execution_context[f"result_{i}"] = result
+                critical_failure = False
+                for i, result in zip(level, level_results):
+                    results.append(result)
+                    
+                    # Store result in context for future function calls
+                    self.execution_context[f"result_{i}"] = result
+                    
+                    # If function failed and it's critical, stop execution
+                    if not result.get('success', False) and self._is_critical_function(function_calls[i]):
+                        logger.warning(f"Critical function failed: {function_calls[i].get('function_name')}")
+                        critical_failure = True
                 
-                # If function failed and it's critical, stop execution
-                if not result.get('success', False) and self._is_critical_function(call):
-                    logger.warning(f"Critical function failed: {call.get('function_name')}")
+                if critical_failure:
                     break
             
-            # Determine overall success
-            success = all(result.get('success', False) for result in results)
-            
+            # Overall success is derived from the results
             execution_result = self._create_execution_result(
-                plan, results, "Execution completed", success
+                plan, results, "Execution completed"
             )
             
             # Store in history
@@ -65,15 +110,70 @@ class ExecutionEngine:
                 plan, [], f"Execution error: {str(e)}", False
             )
     
-    async def _execute_single_function(self, call: Dict[str, Any], call_index: int) -> Dict[str, Any]:
+    def _build_dag(self, function_calls: List[Dict[str, Any]]) -> List[List[int]]:
+        """Group consecutive function calls into levels that can run concurrently
+        
+        A call starts a new level when it references a result from the current
+        level, or uses a positional reference such as {{output_from_previous}}.
+        Levels stay in call order, so positional references resolve as they
+        would sequentially.
+        """
+        levels: List[List[int]] = []
+        current: List[int] = []
+        
+        for i, call in enumerate(function_calls):
+            depends_on_current = False
+            
+            for value in (call.get('parameters') or {}).values():
+                if not isinstance(value, str):
+                    continue
+                for reference in _REFERENCE_RE.findall(value):
+                    index_match = _RESULT_INDEX_RE.match(reference)
+                    if index_match is None or int(index_match.group(1)) in current:
+                        depends_on_current = True
+            
+            if depends_on_current and current:
+                levels.append(current)
+                current = []
+            current.append(i)
+        
+        if current:
+            levels.append(current)
+        
+        return levels
+    
+    def _compile_plan(self, function_calls: List[Dict[str, Any]]) -> List[Dict[str, Tuple[bool, Any]]]:
+        """Build parameter templates for a plan, once per execution"""
+        return [
+            self._compile_parameters(call.get('parameters') or {})
+            for call in function_calls
+        ]
+    
+    def _resolve_functions(self, function_calls: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Look up each distinct function in the plan once, before execution starts"""
+        functions = {}
+        for call in function_calls:
+            function_name = call.get('function_name')
+            if function_name not in functions:
+                functions[function_name] = self.function_registry.get_function(function_name)
+                if functions[function_name] is None:
+                    logger.warning(f"Plan references unknown function: {function_name}")
+        return functions
+    
+    async def _execute_single_function(self, call: Dict[str, Any], call_index: int,
+                                       template: Optional[Dict[str, Tuple[bool, Any]]] = None,
+                                       functions: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Execute a single function call"""
         try:
             function_name = call.get('function_name')
             parameters = call.get('parameters', {})
             description = call.get('description', '')
             
-            # Get the function from registry
-            function = self.function_registry.get_function(function_name)
+            # Get the function from the prefetched plan functions, or the registry
+            if functions is not None:
+                function = functions.get(function_name)
+            else:
+                function = self.function_registry.get_function(function_name)
             if not function:
                 return {
                     'success': False,
@@ -83,19 +183,17 @@ class ExecutionEngine:
                 }
             
             # Process parameters (handle references to previous results)
-            processed_parameters = self._process_parameters(parameters)
+            processed_parameters = self._process_parameters(parameters, template)
             
             # Execute the function
             logger.debug(f"Calling {function_name} with parameters: {processed_parameters}")
             result = await function.execute(**processed_parameters)
             
             # Add metadata to result
-            result.update({
-                'function_name': function_name,
-                'call_index': call_index,
-                'description': description,
-                'parameters_used': processed_parameters
-            })
+            result['function_name'] = function_name
+            result['call_index'] = call_index
+            result['description'] = description
+            result['parameters_used'] = processed_parameters
             
             logger.info(f"Function {function_name} completed with success: {result.get('success', False)}")
             return result
@@ -109,30 +207,35 @@ class ExecutionEngine:
                 'call_index': call_index
             }
     
-    def _process_parameters(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
-        """Process parameters, resolving references to previous results"""
-        processed = {}
+    def _compile_parameters(self, parameters: Dict[str, Any]) -> Dict[str, Tuple[bool, Any]]:
+        """Split parameters into literal values and {{...}} references to previous results"""
+        template = {}
         
         for key, value in parameters.items():
-            if isinstance(value, str) and value.startswith('{{') and value.endswith('}}'):
-                # This is a reference to a previous result
-                reference = value[2:-2].strip()
-                resolved_value = self._resolve_reference(reference)
-                processed[key] = resolved_value
-            else:
-                processed[key] = value
+            match = _REFERENCE_RE.fullmatch(value) if isinstance(value, str) else None
+            template[key] = (True, match.group(1)) if match else (False, value)
+        
+        return template
+    
+    def _process_parameters(self, parameters: Dict[str, Any],
+                            template: Optional[Dict[str, Tuple[bool, Any]]] = None) -> Dict[str, Any]:
+        """Process parameters, resolving references to previous results"""
+        if template is None:
+            template = self._compile_parameters(parameters)
         
-        return processed
+        return {
+            key: self._resolve_reference(target) if is_reference else target
+            for key, (is_reference, target) in template.items()
+        }
     
     def _resolve_reference(self, reference: str) -> Any:
         """Resolve a reference to a previous result"""
         try:
             # Handle different types of references
             if reference == "output_from_previous":
-                # Get the data from the most recent result
+                # Get the data from the most recent result (context is filled in execution order)
                 if self.execution_context:
-                    latest_key = max(self.execution_context.keys())
-                    latest_result = self.execution_context[latest_key]
+                    latest_result = self.execution_context[next(reversed(self.execution_context))]
                     return latest_result.get('data', latest_result)
             
             elif reference.startswith("result_"):
@@ -143,7 +246,9 @@ class ExecutionEngine:
             
             elif "." in reference:
                 # Nested reference like "result_0.data"
-                parts = reference.split('.')
+                parts = self._ref_path_cache.get(reference)
+                if parts is None:
+                    parts = self._ref_path_cache[reference] = tuple(reference.split('.'))
                 obj = self.execution_context
                 for part in parts:
                     if isinstance(obj, dict) and part in obj:
@@ -166,45 +271,55 @@ class ExecutionEngine:
     
     def _is_critical_function(self, call: Dict[str, Any]) -> bool:
         """Determine if a function is critical for the overall plan"""
-        function_name = call.get('function_name', '')
-        
-        # Consider data loading functions as critical
-        critical_functions = [
-            'read_csv', 'read_file', 'read_json', 'read_excel',
-            'query_database', 'fetch_web_page'
-        ]
-        
-        return function_name in critical_functions
+        return call.get('function_name', '') in _CRITICAL_FUNCTIONS
     
     def _create_execution_result(self, plan: Dict[str, Any], results: List[Dict[str, Any]], 
-                               message: str, success: bool) -> Dict[str, Any]:
-        """Create a standardized execution result"""
+                               message: str, success: Optional[bool] = None) -> Dict[str, Any]:
+        """Create a standardized execution result
+        
+        When success is None it is derived from the results: True if none failed.
+        """
+        successful = 0
+        failed = 0
+        for r in results:
+            if r.get('success', False):
+                successful += 1
+            else:
+                failed += 1
+        
+        if success is None:
+            success = failed == 0
+        
         return {
             'success': success,
             'message': message,
             'plan': plan,
             'results': results,
             'execution_summary': {
-                'total_functions': len(results),
-                'successful_functions': sum(1 for r in results if r.get('success', False)),
-                'failed_functions': sum(1 for r in results if not r.get('success', False)),
-                'execution_time': self._get_timestamp()
+                'total_functions': successful + failed,
+                'successful_functions': successful,
+                'failed_functions': failed,
+                'execution_time': get_timestamp()
             }
         }
     
-    def _get_timestamp(self) -> str:
-        """Get current timestamp"""
-        from datetime import datetime
-        return datetime.now().isoformat()
-    
-    def get_execution_history(self) -> List[Dict[str, Any]]:
-        """Get the history of all executions"""
-        return self.results_history.copy()
+    def get_execution_history(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Get the history of recent executions (at most history_limit), oldest first
+        
+        With a limit, only the last limit executions are copied out of the deque.
+        """
+        if limit is None or limit >= len(self.results_history):
+            return list(self.results_history)
+        if limit <= 0:
+            return []
+        # Walk the deque from its newest end, so only the requested entries are visited
+        return list(islice(reversed(self.results_history), limit))[::-1]
     
     def clear_execution_history(self):
         """Clear the execution history"""
         self.results_history.clear()
         self.execution_context.clear()
+        self._ref_path_cache.clear()
     
     def get_function_output(self, execution_result: Dict[str, Any], function_name: str) -> Optional[Any]:
         """Get the output of a specific function from an execution result"""
@@ -218,24 +333,26 @@ class ExecutionEngine:
     
     def simulate_execution(self, plan: Dict[str, Any]) -> Dict[str, Any]:
         """Simulate execution without actually running functions"""
-        function_calls = plan.get('function_calls', [])
-        simulated_results = []
+        function_calls = plan.get('function_calls') or []
+        if not function_calls:
+            return self._create_execution_result(plan, [], "Simulation completed", True)
         
-        for i, call in enumerate(function_calls):
-            function_name = call.get('function_name', 'unknown')
-            
-            # Create a simulated result
-            simulated_result = {
+        simulated_results = [
+            {
                 'success': True,
-                'function_name': function_name,
+                'function_name': call.get('function_name', 'unknown'),
                 'call_index': i,
                 'description': call.get('description', ''),
                 'simulated': True,
-                'message': f"Simulated execution of {function_name}"
+                'message': f"Simulated execution of {call.get('function_name', 'unknown')}"
             }
-            
-            simulated_results.append(simulated_result)
+            for i, call in enumerate(function_calls)
+        ]
         
         return self._create_execution_result(
             plan, simulated_results, "Simulation completed", True
         )
+    
+    async def simulate_execution_async(self, plan: Dict[str, Any]) -> Dict[str, Any]:
+        """Awaitable alias of simulate_execution; runs inline on the event loop"""
+        return self.simulate_execution(plan)
@@ -5,13 +5,55 @@ Main orchestrator for the AI function calling pipeline.
 """
 
 import asyncio
-from typing import Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple, Union
 from loguru import logger
 
 from ..models.model_manager import ModelManager
 from ..models.function_calling import FunctionCallingModel
 from .query_processor import QueryProcessor
 from .execution_engine import ExecutionEngine
+from .batcher import AsyncBatcher
+from .utils import get_timestamp
+
+
+@dataclass(slots=True)
+class QueryResult:
+    """Result of successfully processing one query
+    
+    Supports the dict-style reads (result['plan'], result.get('success')) callers
+    already use; to_dict() gives the plain dict, e.g. for JSON serialization.
+    """
+    success: bool
+    query: str
+    plan: Dict[str, Any]
+    execution_result: Optional[Dict[str, Any]]
+    metadata: Dict[str, Any]
+    
+    def __getitem__(self, key: str) -> Any:
+        if key not in _QUERY_RESULT_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+    
+    def __contains__(self, key: object) -> bool:
+        return key in _QUERY_RESULT_FIELDS
+    
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in _QUERY_RESULT_FIELDS else default
+    
+    def keys(self):
+        return _QUERY_RESULT_FIELDS.keys()
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: getattr(self, key) for key in _QUERY_RESULT_FIELDS}
+
+
+# Field names in declaration order; a dict so lookups are hashed and keys() is ordered
+_QUERY_RESULT_FIELDS = dict.fromkeys(QueryResult.__dataclass_fields__)
+
+# Queries processed at once by a batch unless the caller says otherwise
+DEFAULT_BATCH_CONCURRENCY = 10
 
 
 class PipelineManager:
@@ -23,6 +65,14 @@ class PipelineManager:
         self.function_calling_model = None
         self.query_processor = None
         self.execution_engine = None
+        # Runs the blocking model planning calls so they do not stall the event loop
+        self._planning_executor: Optional[ThreadPoolExecutor] = None
+        # Groups queries arriving together into one batched planning call
+        self._planning_batcher: Optional[AsyncBatcher] = None
+        # Model info taken once the model is loaded; it does not change until shutdown
+        self._model_info_snapshot: Optional[Dict[str, Any]] = None
+        # (registry version, response) of the last get_available_functions call
+        self._available_functions_cache: Tuple[int, Optional[Dict[str, Any]]] = (-1, None)
         self.initialized = False
     
     async def initialize(self) -> bool:
@@ -30,8 +80,9 @@ class PipelineManager:
         try:
             logger.info("Initializing AI Function Calling Pipeline...")
             
-            # Initialize model manager
-            self.model_manager = ModelManager(self.config_path)
+            # Initialize model manager, keeping one that was injected or already created
+            if self.model_manager is None:
+                self.model_manager = ModelManager(self.config_path)
             
             # Try to load a model
             if not self.model_manager.try_load_models():
@@ -41,11 +92,35 @@ class PipelineManager:
             # Initialize function calling model
             self.function_calling_model = FunctionCallingModel(self.model_manager)
             
+            pipeline_config = self.model_manager.config.get("pipeline") or {}
+            
             # Initialize query processor
-            self.query_processor = QueryProcessor(self.function_calling_model)
+            self.query_processor = QueryProcessor(
+                self.function_calling_model,
+                plan_cache_size=pipeline_config.get("plan_cache_size", 1024)
+            )
             
             # Initialize execution engine
-            self.execution_engine = ExecutionEngine()
+            self.execution_engine = ExecutionEngine(
+                parallel_execution=pipeline_config.get("parallel_execution", False),
+                history_limit=pipeline_config.get("history_limit", 500)
+            )
+            
+            if self._planning_executor is None:
+                self._planning_executor = ThreadPoolExecutor(
+                    max_workers=pipeline_config.get("planning_threads", 4),
+                    thread_name_prefix="planning"
+                )
+            
+            planning_batch_size = pipeline_config.get("planning_batch_size", 8)
+            if planning_batch_size > 1:
+                self._planning_batcher = AsyncBatcher(
+                    self._plan_batch,
+                    max_batch_size=planning_batch_size,
+                    max_latency_ms=pipeline_config.get("planning_batch_window_ms", 20)
+                )
+            
+            self._model_info_snapshot = self.model_manager.get_model_info()
             
             self.initialized = True
             logger.info("Pipeline initialization completed successfully")
@@ -55,7 +130,7 @@ class PipelineManager:
             logger.error(f"Pipeline initialization failed: {e}")
             return False
     
-    async def process_query(self, query: str, execute: bool = True, simulate: bool = False) -> Dict[str, Any]:
+    async def process_query(self, query: str, execute: bool = True, simulate: bool = False) -> Union[QueryResult, Dict[str, Any]]:
         """Process a user query end-to-end"""
         if not self.initialized:
             return {
@@ -67,7 +142,10 @@ class PipelineManager:
             logger.info(f"Processing query: {query}")
             
             # Step 1: Process the query to generate function call plan
-            plan = self.query_processor.process_query(query)
+            if self._planning_batcher is not None:
+                plan = await self._planning_batcher.submit(query)
+            else:
+                plan = (await self._plan_batch([query]))[0]
             
             if not plan.get('valid', False):
                 logger.warning("Generated plan is not valid")
@@ -81,17 +159,17 @@ class PipelineManager:
                     execution_result = await self.execution_engine.execute_plan(plan)
             
             # Step 3: Create comprehensive result
-            result = {
-                "success": True,
-                "query": query,
-                "plan": plan,
-                "execution_result": execution_result,
-                "metadata": {
-                    "model_info": self.model_manager.get_model_info(),
+            result = QueryResult(
+                success=True,
+                query=query,
+                plan=plan,
+                execution_result=execution_result,
+                metadata={
+                    "model_info": self._model_info_snapshot,
                     "pipeline_version": "1.0.0",
-                    "timestamp": self._get_timestamp()
+                    "timestamp": get_timestamp()
                 }
-            }
+            )
             
             logger.info("Query processing completed successfully")
             return result
@@ -104,50 +182,108 @@ class PipelineManager:
                 "query": query
             }
     
-    async def process_batch_queries(self, queries: list, execute: bool = True) -> Dict[str, Any]:
-        """Process multiple queries in batch"""
+    async def _plan_batch(self, queries: List[str]) -> List[Dict[str, Any]]:
+        """Plan a batch of queries with one model call, off the event loop"""
+        loop = asyncio.get_running_loop()
+        
+        if len(queries) == 1:
+            plan = await loop.run_in_executor(
+                self._planning_executor, self.query_processor.process_query, queries[0]
+            )
+            return [plan]
+        
+        return await loop.run_in_executor(
+            self._planning_executor, self.query_processor.process_queries, queries
+        )
+    
+    async def process_batch_queries(self, queries: list, execute: bool = True,
+                                    max_concurrency: int = DEFAULT_BATCH_CONCURRENCY) -> Dict[str, Any]:
+        """Process multiple queries in batch, up to max_concurrency at a time"""
         if not self.initialized:
             return {
                 "success": False,
                 "error": "Pipeline not initialized. Call initialize() first."
             }
         
-        results = []
-        successful = 0
-        failed = 0
+        results = [None] * len(queries)
+        async for i, result in self.iter_batch_queries(queries, execute=execute, max_concurrency=max_concurrency):
+            results[i] = result
         
-        for i, query in enumerate(queries):
-            logger.info(f"Processing batch query {i+1}/{len(queries)}")
-            
-            result = await self.process_query(query, execute=execute)
-            results.append(result)
-            
-            if result.get('success', False):
-                successful += 1
-            else:
-                failed += 1
+        return self.build_batch_result(results)
+    
+    @staticmethod
+    def build_batch_result(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Aggregate per-query results, in query order, into a batch result"""
+        successful = sum(1 for result in results if result.get('success', False))
         
         return {
             "success": True,
             "batch_results": results,
             "summary": {
-                "total_queries": len(queries),
+                "total_queries": len(results),
                 "successful": successful,
-                "failed": failed,
-                "success_rate": successful / len(queries) if queries else 0
+                "failed": len(results) - successful,
+                "success_rate": successful / len(results) if results else 0
             }
         }
     
+    async def iter_batch_queries(self, queries: list, execute: bool = True,
+                                 max_concurrency: int = DEFAULT_BATCH_CONCURRENCY) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """Process multiple queries, yielding (index, result) pairs as each one finishes
+        
+        Callers that write results out as they arrive never hold the whole batch.
+        """
+        if not self.initialized:
+            raise RuntimeError("Pipeline not initialized. Call initialize() first.")
+        
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        
+        async def run(i: int, query: str) -> Tuple[int, Dict[str, Any]]:
+            async with semaphore:
+                logger.info(f"Processing batch query {i+1}/{len(queries)}")
+                try:
+                    return i, await self.process_query(query, execute=execute)
+                except Exception as e:
+                    return i, {"success": False, "error": str(e), "query": query}
+        
+        # Dispatch queries shortest first, so the planning batches formed along the way
+        # hold prompts of similar length and need little padding
+        order = sorted(range(len(queries)), key=lambda i: self._query_length(queries[i]))
+        tasks = [asyncio.create_task(run(i, queries[i])) for i in order]
+        
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield await finished
+        finally:
+            # The caller may stop iterating early
+            for task in tasks:
+                task.cancel()
+    
+    def _query_length(self, query: str) -> int:
+        """Length of a query in tokens, or in characters without a tokenizer"""
+        tokenizer = getattr(self.model_manager, "tokenizer", None)
+        if tokenizer is None:
+            return len(query)
+        return len(tokenizer.encode(query, add_special_tokens=False))
+    
     def get_available_functions(self) -> Dict[str, Any]:
-        """Get information about all available functions"""
+        """Get information about all available functions, cached between registrations
+        
+        The returned dict is shared between callers and must not be modified.
+        """
         if not self.initialized:
             return {"error": "Pipeline not initialized"}
         
-        return {
-            "functions": self.query_processor.function_registry.get_function_schemas(),
-            "categories": list(self.query_processor.function_registry.categories.keys()),
-            "total_functions": len(self.query_processor.function_registry.functions)
-        }
+        registry = self.query_processor.function_registry
+        version, available = self._available_functions_cache
+        if version != registry.version or available is None:
+            available = {
+                "functions": self.query_processor.get_function_schemas(),
+                "categories": list(registry.categories.keys()),
+                "total_functions": len(registry.functions)
+            }
+            self._available_functions_cache = (registry.version, available)
+        return available
     
     def search_functions(self, keyword: str) -> Dict[str, Any]:
         """Search for functions by keyword"""
@@ -159,13 +295,13 @@ class PipelineManager:
             "functions": self.query_processor.search_functions(keyword)
         }
     
-    def get_execution_history(self) -> Dict[str, Any]:
-        """Get the execution history"""
+    def get_execution_history(self, limit: Optional[int] = None) -> Dict[str, Any]:
+        """Get the execution history, optionally only the last limit executions"""
         if not self.initialized:
             return {"error": "Pipeline not initialized"}
         
         return {
-            "history": self.execution_engine.get_execution_history(),
+            "history": self.execution_engine.get_execution_history(limit),
             "total_executions": len(self.execution_engine.results_history)
         }
     
@@ -176,10 +312,15 @@ class PipelineManager:
     
     def get_pipeline_status(self) -> Dict[str, Any]:
         """Get the current status of the pipeline"""
+        if self._model_info_snapshot is not None:
+            model_info = self._model_info_snapshot
+        else:
+            model_info = self.model_manager.get_model_info() if self.model_manager else {}
+        
         return {
             "initialized": self.initialized,
             "model_loaded": self.model_manager.is_loaded() if self.model_manager else False,
-            "model_info": self.model_manager.get_model_info() if self.model_manager else {},
+            "model_info": model_info,
             "available_functions": len(self.query_processor.function_registry.functions) if self.query_processor else 0
         }
     
@@ -187,8 +328,19 @@ class PipelineManager:
         """Shutdown the pipeline and cleanup resources"""
         logger.info("Shutting down pipeline...")
         
+        # Stop planning before the model goes away, so no batch in flight reaches an
+        # unloaded model; waiting for the executor lets a running batch finish first
+        if self._planning_batcher is not None:
+            await self._planning_batcher.close()
+            self._planning_batcher = None
+        
+        if self._planning_executor is not None:
+            await asyncio.to_thread(self._planning_executor.shutdown, wait=True, cancel_futures=True)
+            self._planning_executor = None
+        
         if self.model_manager:
             self.model_manager.unload_model()
+        self._model_info_snapshot = None
         
         if self.execution_engine:
             self.execution_engine.clear_execution_history()
@@ -196,11 +348,6 @@ class PipelineManager:
         self.initialized = False
         logger.info("Pipeline shutdown completed")
     
-    def _get_timestamp(self) -> str:
-        """Get current timestamp"""
-        from datetime import datetime
-        return datetime.now().isoformat()
-    
     async def __aenter__(self):
         """Async context manager entry"""
         await self.initialize()
@@ -4,91 +4,242 @@ Query Processor
 Processes natural language queries and converts them to function call plans.
 """
 
+import copy
 import re
-from typing import Dict, Any, List, Optional
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Dict, Any, List, Optional, Tuple
 from loguru import logger
 from ..models.function_calling import FunctionCallingModel
 from ..functions import registry
+from .utils import get_timestamp
 
 
+# Whitespace runs, and common abbreviations expanded before planning; the alternation
+# tries longer abbreviations first so "w/o" is not consumed as "w/"
+_WS_RE = re.compile(r'\s+')
+_ABBREVIATIONS = {
+    "w/": "with",
+    "w/o": "without",
+    "etc.": "and so on",
+    "e.g.": "for example",
+    "i.e.": "that is",
+}
+_ABBREVIATION_RE = re.compile(
+    '|'.join(re.escape(abbrev) for abbrev in sorted(_ABBREVIATIONS, key=len, reverse=True))
+)
+
+# Context clues appended to queries mentioning all of their keywords, in order; the
+# keywords are found in one scan, the lookahead also catching overlapping matches
+_CONTEXT_CLUES = (
+    (frozenset({"invoice", "march"}), " (Note: Look for invoice data in CSV or database format)"),
+    (frozenset({"email", "send"}), " (Note: Use email function to send messages)"),
+)
+_CONTEXT_KEYWORDS_RE = re.compile(
+    '(?=({}))'.format('|'.join(sorted(set().union(*(keywords for keywords, _ in _CONTEXT_CLUES)))))
+)
+
+# Words counted by analyze_query_complexity; the three sets are disjoint
+_DATA_KEYWORDS = frozenset({'read', 'load', 'import', 'data', 'csv', 'excel', 'database'})
+_PROCESS_KEYWORDS = frozenset({'filter', 'sort', 'group', 'summarize', 'calculate', 'analyze'})
+_OUTPUT_KEYWORDS = frozenset({'send', 'email', 'save', 'write', 'export', 'notify'})
+
+# Defaults filled in by _fix_common_issues for parameters a plan left out
+_FUNCTION_DEFAULTS: Dict[str, Dict[str, Any]] = {
+    'send_email': {
+        'to_email': 'abhayrajputcse@gmail.com',
+        'subject': 'Automated Email',
+        'body': 'This is an automated email.',
+    },
+    'read_csv': {'file_path': 'data/sample.csv'},
+    'read_file': {'file_path': 'data/sample.txt'},
+}
+
+# Word tokens of function names, descriptions and categories for the search index
+_TOKEN_RE = re.compile(r'\w+')
+
 class QueryProcessor:
     """Processes user queries and generates function call plans"""
     
-    def __init__(self, function_calling_model: FunctionCallingModel):
+    def __init__(self, function_calling_model: FunctionCallingModel, plan_cache_size: int = 1024):
         self.function_calling_model = function_calling_model
         self.function_registry = registry
+        # Function schemas, rebuilt only when the registry version changes
+        self._schemas_cache: Optional[List[Dict[str, Any]]] = None
+        self._schemas_version = -1
+        # Search index over the cached schemas: function dicts by name, their lowercased
+        # searchable fields, and lowercase word token -> names of the functions using it
+        self._function_dicts: Dict[str, Dict[str, Any]] = {}
+        self._search_fields: Dict[str, tuple] = {}
+        self._token_index: Dict[str, set] = {}
+        self._index_version = -1
+        # Finalized plans by (processed query, registry version), least recently used first;
+        # planning runs on worker threads, hence the lock
+        self.plan_cache_size = plan_cache_size
+        self._plan_cache: "OrderedDict[Tuple[str, int], Dict[str, Any]]" = OrderedDict()
+        self._plan_cache_lock = threading.Lock()
     
     def process_query(self, query: str) -> Dict[str, Any]:
         """Process a user query and return a function call plan"""
         try:
             logger.info(f"Processing query: {query}")
             
+            # Nothing to plan for an empty query, so skip the model call
+            if not query.strip():
+                return self._create_error_response(query, "Query is empty")
+            
             # Preprocess the query
             processed_query = self._preprocess_query(query)
             
             # Get available functions
-            available_functions = self.function_registry.get_function_schemas()
-            
-            # Generate function call plan
-            plan = self.function_calling_model.plan_function_calls(
-                processed_query, 
-                available_functions
-            )
-            
-            # Validate the plan
-            is_valid, errors = self.function_calling_model.validate_function_calls(
-                plan.get('function_calls', []), 
-                available_functions
-            )
-            
-            if not is_valid:
-                logger.warning(f"Invalid function calls: {errors}")
-                # Try to fix common issues
-                plan = self._fix_common_issues(plan, errors)
+            available_functions = self.get_function_schemas()
             
-            # Optimize the function sequence
-            if 'function_calls' in plan:
-                plan['function_calls'] = self.function_calling_model.optimize_function_sequence(
-                    plan['function_calls']
+            plan = self._get_cached_plan(processed_query)
+            if plan is None:
+                # Generate function call plan
+                plan = self.function_calling_model.plan_function_calls(
+                    processed_query, 
+                    available_functions
                 )
+                plan = self._finalize_plan(plan, available_functions)
+                self._cache_plan(processed_query, plan)
             
-            # Add metadata
-            plan['query'] = query
-            plan['processed_query'] = processed_query
-            plan['timestamp'] = self._get_timestamp()
-            plan['valid'] = is_valid
-            plan['errors'] = errors if not is_valid else []
-            
-            logger.info(f"Generated plan with {len(plan.get('function_calls', []))} function calls")
-            return plan
+            return self._annotate_plan(plan, query, processed_query)
             
         except Exception as e:
             logger.error(f"Error processing query: {e}")
             return self._create_error_response(query, str(e))
     
+    def process_queries(self, queries: List[str]) -> List[Dict[str, Any]]:
+        """Process several queries with one batched planning call"""
+        try:
+            logger.info(f"Processing {len(queries)} queries in one batch")
+            
+            processed_queries = [self._preprocess_query(query) for query in queries]
+            available_functions = self.get_function_schemas()
+            
+            # Only distinct, non-empty queries without a cached plan go to the model
+            plans = {}
+            for processed_query in processed_queries:
+                if processed_query and processed_query not in plans:
+                    plans[processed_query] = self._get_cached_plan(processed_query)
+            to_plan = [processed_query for processed_query, plan in plans.items() if plan is None]
+            
+            if to_plan:
+                generated = self.function_calling_model.plan_function_calls_batch(
+                    to_plan,
+                    available_functions
+                )
+                for processed_query, plan in zip(to_plan, generated):
+                    try:
+                        plans[processed_query] = self._finalize_plan(plan, available_functions)
+                        self._cache_plan(processed_query, plans[processed_query])
+                    except Exception as e:
+                        logger.error(f"Error processing query: {e}")
+                        plans[processed_query] = e
+        except Exception as e:
+            logger.error(f"Error processing query batch: {e}")
+            return [self._create_error_response(query, str(e)) for query in queries]
+        
+        results = []
+        for query, processed_query in zip(queries, processed_queries):
+            plan = plans.get(processed_query)
+            if not processed_query:
+                results.append(self._create_error_response(query, "Query is empty"))
+            elif isinstance(plan, Exception):
+                results.append(self._create_error_response(query, str(plan)))
+            else:
+                results.append(self._annotate_plan(plan, query, processed_query))
+        return results
+    
+    def _finalize_plan(self, plan: Dict[str, Any], available_functions: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Validate, fix and optimize a generated plan"""
+        # Nothing to validate, fix or deduplicate in a plan without calls
+        if not plan.get('function_calls'):
+            plan['valid'] = True
+            plan['errors'] = []
+            logger.info("Generated plan with 0 function calls")
+            return plan
+        
+        # Validate the plan
+        is_valid, errors = self.function_calling_model.validate_function_calls(
+            plan.get('function_calls', []), 
+            available_functions
+        )
+        
+        if not is_valid:
+            logger.warning(f"Invalid function calls: {errors}")
+            # Try to fix common issues
+            plan = self._fix_common_issues(plan, errors)
+        
+        # Optimize the function sequence
+        if 'function_calls' in plan:
+            plan['function_calls'] = self.function_calling_model.optimize_function_sequence(
+                plan['function_calls']
+            )
+        
+        plan['valid'] = is_valid
+        plan['errors'] = errors if not is_valid else []
+        
+        logger.info(f"Generated plan with {len(plan.get('function_calls', []))} function calls")
+        return plan
+    
+    def _annotate_plan(self, plan: Dict[str, Any], query: str, processed_query: str) -> Dict[str, Any]:
+        """Copy a (possibly cached) plan and add this request's metadata"""
+        # Deep copy, so callers changing the calls cannot change the cached plan
+        return {
+            **copy.deepcopy(plan),
+            'query': query,
+            'processed_query': processed_query,
+            'timestamp': get_timestamp()
+        }
+    
+    def _get_cached_plan(self, processed_query: str) -> Optional[Dict[str, Any]]:
+        """Get the plan generated earlier for this query and function catalog"""
+        key = (processed_query, self.function_registry.version)
+        with self._plan_cache_lock:
+            plan = self._plan_cache.get(key)
+            if plan is not None:
+                self._plan_cache.move_to_end(key)
+        if plan is not None:
+            logger.debug(f"Reusing cached plan for: {processed_query}")
+        return plan
+    
+    def _cache_plan(self, processed_query: str, plan: Dict[str, Any]):
+        """Remember a plan, evicting the least recently used one when full
+        
+        Fallback, error and invalid plans stand in for a failed model call, which
+        may well succeed next time, so they are not remembered.
+        """
+        if (self.plan_cache_size <= 0 or plan.get('fallback') or 'error' in plan
+                or not plan.get('valid', True)):
+            return
+        key = (processed_query, self.function_registry.version)
+        with self._plan_cache_lock:
+            self._plan_cache[key] = plan
+            self._plan_cache.move_to_end(key)
+            if len(self._plan_cache) > self.plan_cache_size:
+                self._plan_cache.popitem(last=False)
+    
+    def get_function_schemas(self) -> List[Dict[str, Any]]:
+        """Get schemas for all registered functions, cached between registrations"""
+        if self._schemas_version != self.function_registry.version:
+            self._schemas_cache = self.function_registry.get_function_schemas()
+            self._schemas_version = self.function_registry.version
+        return self._schemas_cache
+    
     def _preprocess_query(self, query: str) -> str:
         """Preprocess the query to improve AI understanding"""
         # Remove extra whitespace
-        query = re.sub(r'\s+', ' ', query.strip())
-        
-        # Expand common abbreviations
-        abbreviations = {
-            "w/": "with",
-            "w/o": "without",
-            "etc.": "and so on",
-            "e.g.": "for example",
-            "i.e.": "that is",
-        }
+        query = _WS_RE.sub(' ', query.strip())
         
-        for abbrev, expansion in abbreviations.items():
-            query = query.replace(abbrev, expansion)
+        # Expand common abbreviations in a single pass
+        query = _ABBREVIATION_RE.sub(lambda match: _ABBREVIATIONS[match.group(0)], query)
         
         # Add context clues for better understanding
-        if "invoice" in query.lower() and "march" in query.lower():
-            query += " (Note: Look for invoice data in CSV or database format)"
-        
-        if "email" in query.lower() and "send" in query.lower():
-            query += " (Note: Use email function to send messages)"
+        hits = set(_CONTEXT_KEYWORDS_RE.findall(query.lower()))
+        if hits:
+            query += "".join(note for keywords, note in _CONTEXT_CLUES if keywords <= hits)
         
         return query
     
@@ -100,39 +251,15 @@ class QueryProcessor:
         fixed_calls = []
         
         for call in plan['function_calls']:
-            # Fix missing parameters
-            if 'parameters' not in call:
-                call['parameters'] = {}
-            
-            # Add default values for common missing parameters
-            function_name = call.get('function_name', '')
-            
-            if function_name == 'send_email':
-                if 'to_email' not in call['parameters']:
-                    call['parameters']['to_email'] = 'abhayrajputcse@gmail.com'
-                if 'subject' not in call['parameters']:
-                    call['parameters']['subject'] = 'Automated Email'
-                if 'body' not in call['parameters']:
-                    call['parameters']['body'] = 'This is an automated email.'
-            
-            elif function_name == 'read_csv':
-                if 'file_path' not in call['parameters']:
-                    call['parameters']['file_path'] = 'data/sample.csv'
-            
-            elif function_name == 'read_file':
-                if 'file_path' not in call['parameters']:
-                    call['parameters']['file_path'] = 'data/sample.txt'
+            # Fill in default values for common missing parameters; given values win
+            defaults = _FUNCTION_DEFAULTS.get(call.get('function_name', ''), {})
+            call['parameters'] = {**defaults, **(call.get('parameters') or {})}
             
             fixed_calls.append(call)
         
         plan['function_calls'] = fixed_calls
         return plan
     
-    def _get_timestamp(self) -> str:
-        """Get current timestamp"""
-        from datetime import datetime
-        return datetime.now().isoformat()
-    
     def _create_error_response(self, query: str, error: str) -> Dict[str, Any]:
         """Create an error response"""
         return {
@@ -140,16 +267,37 @@ class QueryProcessor:
             "plan": "Error occurred while processing query",
             "function_calls": [],
             "error": error,
-            "timestamp": self._get_timestamp(),
+            "timestamp": get_timestamp(),
             "valid": False
         }
     
+    def _ensure_search_index(self):
+        """Rebuild the function search index if the registry has changed"""
+        if self._index_version == self.function_registry.version:
+            return
+        
+        function_dicts = {}
+        search_fields = {}
+        token_index = defaultdict(set)
+        
+        for func_dict in self.get_function_schemas():
+            name = func_dict['name']
+            fields = (name.lower(), func_dict['description'].lower(), func_dict['category'].lower())
+            function_dicts[name] = func_dict
+            search_fields[name] = fields
+            for field in fields:
+                for token in _TOKEN_RE.findall(field):
+                    token_index[token].add(name)
+        
+        self._function_dicts = function_dicts
+        self._search_fields = search_fields
+        self._token_index = dict(token_index)
+        self._index_version = self.function_registry.version
+    
     def get_function_info(self, function_name: str) -> Optional[Dict[str, Any]]:
         """Get information about a specific function"""
-        function = self.function_registry.get_function(function_name)
-        if function:
-            return function.to_dict()
-        return None
+        self._ensure_search_index()
+        return self._function_dicts.get(function_name)
     
     def list_functions_by_category(self, category: str) -> List[Dict[str, Any]]:
         """List all functions in a specific category"""
@@ -158,32 +306,37 @@ class QueryProcessor:
     
     def search_functions(self, keyword: str) -> List[Dict[str, Any]]:
         """Search for functions by keyword"""
-        all_functions = self.function_registry.get_all_functions()
-        matching_functions = []
-        
+        self._ensure_search_index()
         keyword_lower = keyword.lower()
         
-        for func in all_functions:
-            func_dict = func.to_dict()
-            if (keyword_lower in func_dict['name'].lower() or 
-                keyword_lower in func_dict['description'].lower() or
-                keyword_lower in func_dict['category'].lower()):
-                matching_functions.append(func_dict)
+        if _TOKEN_RE.fullmatch(keyword_lower):
+            # A single word can only occur inside one token, so only the index
+            # vocabulary has to be scanned rather than every description
+            matching_names = set()
+            for token, names in self._token_index.items():
+                if keyword_lower in token:
+                    matching_names |= names
+        else:
+            # Phrases and punctuation fall back to substring matching on each field
+            matching_names = {
+                name for name, fields in self._search_fields.items()
+                if any(keyword_lower in field for field in fields)
+            }
         
-        return matching_functions
+        # Keep registry order
+        return [func_dict for name, func_dict in self._function_dicts.items() if name in matching_names]
     
     def analyze_query_complexity(self, query: str) -> Dict[str, Any]:
         """Analyze the complexity of a query"""
-        words = query.split()
-        
-        # Count different types of operations
-        data_keywords = ['read', 'load', 'import', 'data', 'csv', 'excel', 'database']
-        process_keywords = ['filter', 'sort', 'group', 'summarize', 'calculate', 'analyze']
-        output_keywords = ['send', 'email', 'save', 'write', 'export', 'notify']
-        
-        data_ops = sum(1 for word in words if word.lower() in data_keywords)
-        process_ops = sum(1 for word in words if word.lower() in process_keywords)
-        output_ops = sum(1 for word in words if word.lower() in output_keywords)
+        # Count different types of operations in a single pass
+        data_ops = process_ops = output_ops = 0
+        for word in query.lower().split():
+            if word in _DATA_KEYWORDS:
+                data_ops += 1
+            elif word in _PROCESS_KEYWORDS:
+                process_ops += 1
+            elif word in _OUTPUT_KEYWORDS:
+                output_ops += 1
         
         complexity_score = data_ops + process_ops + output_ops
         
@@ -0,0 +1,29 @@
+"""
+Pipeline Utilities
+
+Helpers shared by the pipeline components.
+"""
+
+import time
+from datetime import datetime
+
+
+# (second, ISO date and time) of the last timestamp; replaced as one tuple so
+# planning threads never see a second paired with another second's prefix
+_timestamp_cache = (None, "")
+
+
+def get_timestamp() -> str:
+    """Get the current local time as datetime.now().isoformat() formats it
+
+    The date and time are formatted once per second; within it only the
+    microseconds are appended, and left out when zero as isoformat() does.
+    """
+    global _timestamp_cache
+    second, nanoseconds = divmod(time.time_ns(), 1_000_000_000)
+    cached_second, prefix = _timestamp_cache
+    if second != cached_second:
+        prefix = datetime.fromtimestamp(second).isoformat()
+        _timestamp_cache = (second, prefix)
+    microseconds = nanoseconds // 1000
+    return f"{prefix}.{microseconds:06d}" if microseconds else prefix
@@ -4,46 +4,31 @@ Test cases for function library
 
 import pytest
 import asyncio
-import tempfile
-import os
-from pathlib import Path
+import io
 
-# Add src to path
-import sys
-sys.path.append(str(Path(__file__).parent.parent / "src"))
-
-from functions.data_processing import ReadCSVFunction, FilterDataFunction, SummarizeDataFunction
-from functions.file_operations import ReadFileFunction, WriteFileFunction
-from functions.text_operations import TextAnalysisFunction, FormatTextFunction
-from functions.math_operations import CalculateFunction, StatisticsFunction
-from functions.datetime_operations import GetCurrentTimeFunction
+from project_codemate.functions.data_processing import ReadCSVFunction, FilterDataFunction, SummarizeDataFunction
+from project_codemate.functions.file_operations import ReadFileFunction, WriteFileFunction
+from project_codemate.functions.text_operations import TextAnalysisFunction, FormatTextFunction
+from project_codemate.functions.math_operations import CalculateFunction, StatisticsFunction
+from project_codemate.functions.datetime_operations import GetCurrentTimeFunction
 
 
 class TestDataProcessingFunctions:
     """Test data processing functions"""
     
-    @pytest.mark.asyncio
     async def test_read_csv_function(self):
         """Test CSV reading function"""
-        # Create a temporary CSV file
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False) as f:
-            f.write("name,age,city\n")
-            f.write("John,25,New York\n")
-            f.write("Jane,30,Los Angeles\n")
-            temp_file = f.name
-        
-        try:
-            func = ReadCSVFunction()
-            result = await func.execute(temp_file)
-            
-            assert result['success'] is True
-            assert len(result['data']) == 2
-            assert result['data'][0]['name'] == 'John'
-            assert result['data'][1]['age'] == '30'
-        finally:
-            os.unlink(temp_file)
+        # Read the CSV from memory rather than a temporary file
+        csv_file = io.StringIO("name,age,city\nJohn,25,New York\nJane,30,Los Angeles\n")
+        
+        func = ReadCSVFunction()
+        result = await func.execute(csv_file)
+        
+        assert result['success'] is True
+        assert len(result['data']) == 2
+        assert result['data'][0]['name'] == 'John'
+        assert result['data'][1]['age'] == 30
     
-    @pytest.mark.asyncio
     async def test_filter_data_function(self):
         """Test data filtering function"""
         data = [
@@ -59,7 +44,6 @@ class TestDataProcessingFunctions:
         assert len(result['data']) == 2
         assert all(row['age'] == 25 for row in result['data'])
     
-    @pytest.mark.asyncio
     async def test_summarize_data_function(self):
         """Test data summarization function"""
         data = [
@@ -80,37 +64,29 @@ class TestDataProcessingFunctions:
 class TestFileOperationsFunctions:
     """Test file operations functions"""
     
-    @pytest.mark.asyncio
-    async def test_write_and_read_file(self):
+    async def test_write_and_read_file(self, tmp_path):
         """Test file writing and reading"""
         content = "Hello, World!\nThis is a test file."
+        temp_file = str(tmp_path / "test.txt")
+        
+        # Test writing
+        write_func = WriteFileFunction()
+        write_result = await write_func.execute(temp_file, content)
+        
+        assert write_result['success'] is True
+        
+        # Test reading
+        read_func = ReadFileFunction()
+        read_result = await read_func.execute(temp_file)
         
-        with tempfile.NamedTemporaryFile(mode='w', delete=False) as f:
-            temp_file = f.name
-        
-        try:
-            # Test writing
-            write_func = WriteFileFunction()
-            write_result = await write_func.execute(temp_file, content)
-            
-            assert write_result['success'] is True
-            
-            # Test reading
-            read_func = ReadFileFunction()
-            read_result = await read_func.execute(temp_file)
-            
-            assert read_result['success'] is True
-            assert read_result['content'] == content
-            assert read_result['lines'] == 2
-        finally:
-            if os.path.exists(temp_file):
-                os.unlink(temp_file)
+        assert read_result['success'] is True
+        assert read_result['content'] == content
+        assert read_result['lines'] == 2
 
 
 class TestTextOperationsFunctions:
     """Test text operations functions"""
     
-    @pytest.mark.asyncio
     async def test_text_analysis_function(self):
         """Test text analysis function"""
         text = "Hello world! This is a test. How are you?"
@@ -123,7 +99,6 @@ class TestTextOperationsFunctions:
         assert result['analysis']['sentence_count'] == 3
         assert result['analysis']['character_count'] == len(text)
     
-    @pytest.mark.asyncio
     async def test_format_text_function(self):
         """Test text formatting function"""
         text = "hello world"
@@ -144,7 +119,6 @@ class TestTextOperationsFunctions:
 class TestMathOperationsFunctions:
     """Test math operations functions"""
     
-    @pytest.mark.asyncio
     async def test_calculate_function(self):
         """Test calculation function"""
         func = CalculateFunction()
@@ -159,7 +133,6 @@ class TestMathOperationsFunctions:
         assert result['success'] is True
         assert result['result'] == 4.0
     
-    @pytest.mark.asyncio
     async def test_statistics_function(self):
         """Test statistics function"""
         numbers = [1, 2, 3, 4, 5]
@@ -176,7 +149,6 @@ class TestMathOperationsFunctions:
 class TestDateTimeOperationsFunctions:
     """Test datetime operations functions"""
     
-    @pytest.mark.asyncio
     async def test_get_current_time_function(self):
         """Test get current time function"""
         func = GetCurrentTimeFunction()
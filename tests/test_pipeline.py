@@ -4,23 +4,22 @@ Test cases for the pipeline components
 
 import pytest
 import asyncio
-from unittest.mock import Mock, AsyncMock
-from pathlib import Path
-
-# Add src to path
+import subprocess
 import sys
-sys.path.append(str(Path(__file__).parent.parent / "src"))
+from pathlib import Path
+from unittest.mock import Mock, AsyncMock
 
-from pipeline.pipeline_manager import PipelineManager
-from pipeline.query_processor import QueryProcessor
-from pipeline.execution_engine import ExecutionEngine
-from models.function_calling import FunctionCallingModel
+from project_codemate.pipeline.pipeline_manager import PipelineManager
+from project_codemate.pipeline.query_processor import QueryProcessor
+from project_codemate.pipeline.execution_engine import ExecutionEngine
+from project_codemate.pipeline.batcher import AsyncBatcher
+from project_codemate.models.function_calling import FunctionCallingModel
+from project_codemate.functions.math_operations import CalculateFunction
 
 
 class TestPipelineManager:
     """Test the main pipeline manager"""
     
-    @pytest.mark.asyncio
     async def test_pipeline_initialization(self):
         """Test pipeline initialization"""
         # This test might fail if models can't be loaded, so we'll mock it
@@ -28,6 +27,7 @@ class TestPipelineManager:
         
         # Mock the model loading
         pipeline.model_manager = Mock()
+        pipeline.model_manager.config = {}
         pipeline.model_manager.try_load_models = Mock(return_value=True)
         pipeline.model_manager.get_model_info = Mock(return_value={"loaded": True})
         pipeline.model_manager.is_loaded = Mock(return_value=True)
@@ -35,6 +35,8 @@ class TestPipelineManager:
         success = await pipeline.initialize()
         assert success is True
         assert pipeline.initialized is True
+        
+        await pipeline.shutdown()
     
     def test_pipeline_status(self):
         """Test pipeline status reporting"""
@@ -49,9 +51,9 @@ class TestPipelineManager:
 class TestQueryProcessor:
     """Test the query processor"""
     
-    def setup_method(self):
-        """Setup test fixtures"""
-        # Mock the function calling model
+    @pytest.fixture(autouse=True)
+    def setup_processor(self):
+        """Build a fresh model mock and processor for each test, as the tests modify them"""
         self.mock_model = Mock()
         self.mock_model.plan_function_calls = Mock(return_value={
             "plan": "Test plan",
@@ -86,6 +88,51 @@ class TestQueryProcessor:
         assert 'query' in result
         assert result['query'] == query
     
+    def test_repeated_query_reuses_plan(self):
+        """Test that repeated queries are planned once and empty ones not at all"""
+        first = self.processor.process_query("Send an email")
+        second = self.processor.process_query("Send  an email")
+        
+        assert self.mock_model.plan_function_calls.call_count == 1
+        assert second['function_calls'] == first['function_calls']
+        assert second['query'] == "Send  an email"
+        
+        empty = self.processor.process_query("   ")
+        assert empty['valid'] is False
+        assert self.mock_model.plan_function_calls.call_count == 1
+    
+    def test_cached_plan_is_copied_and_fallback_not_cached(self):
+        """Test that cached plans are handed out as copies and fallback plans are replanned"""
+        first = self.processor.process_query("Send an email")
+        first['function_calls'][0]['parameters']['param1'] = "changed"
+        second = self.processor.process_query("Send an email")
+        assert second['function_calls'][0]['parameters'] == {"param1": "value1"}
+        
+        self.mock_model.plan_function_calls.return_value = {
+            "plan": "Fallback plan", "fallback": True, "function_calls": []
+        }
+        self.processor.process_query("What time is it?")
+        self.processor.process_query("What time is it?")
+        assert self.mock_model.plan_function_calls.call_count == 3
+    
+    def test_invalid_plan_not_cached(self):
+        """Test that a plan failing validation is replanned on the next call"""
+        self.mock_model.validate_function_calls.return_value = (False, ["Unknown function: test_function"])
+        first = self.processor.process_query("Send an email")
+        self.processor.process_query("Send an email")
+        assert first['valid'] is False
+        assert self.mock_model.plan_function_calls.call_count == 2
+    
+    def test_function_schemas_cached(self, monkeypatch):
+        """Test that schemas are reused until the registry changes"""
+        schemas = self.processor.get_function_schemas()
+        assert self.processor.get_function_schemas() is schemas
+        
+        # The registry is global; monkeypatch restores its version after the test
+        registry = self.processor.function_registry
+        monkeypatch.setattr(registry, "version", registry.version + 1)
+        assert self.processor.get_function_schemas() is not schemas
+    
     def test_analyze_query_complexity(self):
         """Test query complexity analysis"""
         simple_query = "What time is it?"
@@ -106,7 +153,6 @@ class TestExecutionEngine:
         """Setup test fixtures"""
         self.engine = ExecutionEngine()
     
-    @pytest.mark.asyncio
     async def test_execute_plan_empty(self):
         """Test executing an empty plan"""
         plan = {"function_calls": []}
@@ -115,6 +161,22 @@ class TestExecutionEngine:
         assert result['success'] is False
         assert "No function calls" in result['message']
     
+    async def test_reexecuted_plan_uses_edited_parameters(self):
+        """Test that editing a plan in place takes effect when it is executed again"""
+        self.engine.function_registry = Mock()
+        self.engine.function_registry.get_function = Mock(return_value=CalculateFunction())
+        plan = {
+            "function_calls": [
+                {"function_name": "calculate", "parameters": {"expression": "1+1"}}
+            ]
+        }
+        first = await self.engine.execute_plan(plan)
+        plan['function_calls'][0]['parameters']['expression'] = "2*3"
+        second = await self.engine.execute_plan(plan)
+        
+        assert first['results'][0]['result'] == 2
+        assert second['results'][0]['result'] == 6
+    
     def test_parameter_processing(self):
         """Test parameter processing with references"""
         # Setup some context
@@ -132,6 +194,25 @@ class TestExecutionEngine:
         assert processed['column'] == "amount"
         assert processed['data'] == [{"amount": 100}, {"amount": 200}]
     
+    def test_previous_output_resolution(self):
+        """Test that output_from_previous resolves to the latest result"""
+        self.engine.execution_context = {
+            f"result_{i}": {"data": i, "success": True} for i in range(11)
+        }
+        
+        # result_10 is the latest even though "result_9" sorts after it
+        assert self.engine._resolve_reference("output_from_previous") == 10
+    
+    def test_execution_history_limit(self):
+        """Test that the history is bounded and a limit returns the newest entries"""
+        engine = ExecutionEngine(history_limit=3)
+        for i in range(5):
+            engine.results_history.append({"id": i})
+        
+        assert [r["id"] for r in engine.get_execution_history()] == [2, 3, 4]
+        assert [r["id"] for r in engine.get_execution_history(limit=2)] == [3, 4]
+        assert engine.get_execution_history(limit=0) == []
+    
     def test_reference_resolution(self):
         """Test reference resolution"""
         self.engine.execution_context = {
@@ -146,6 +227,20 @@ class TestExecutionEngine:
         result = self.engine._resolve_reference("result_0.data")
         assert result == "test_data"
     
+    def test_dependency_levels(self):
+        """Test grouping of independent function calls into levels"""
+        function_calls = [
+            {"function_name": "get_system_info", "parameters": {}},
+            {"function_name": "get_current_time", "parameters": {}},
+            {"function_name": "summarize_data", "parameters": {"data": "{{result_1.data}}"}},
+            {"function_name": "send_email", "parameters": {"body": "{{output_from_previous}}"}},
+            {"function_name": "get_weather", "parameters": {"data": "{{result_0}}"}}
+        ]
+        
+        levels = self.engine._build_dag(function_calls)
+        
+        assert levels == [[0, 1], [2], [3, 4]]
+    
     def test_simulation_mode(self):
         """Test execution simulation"""
         plan = {
@@ -199,6 +294,21 @@ class TestFunctionCalling:
         
         assert result is None
     
+    def test_response_repair(self):
+        """Test repair of truncated or malformed JSON responses"""
+        pytest.importorskip("json_repair")
+        
+        # Trailing comma
+        result = self.function_calling._parse_response('{"plan": "test plan", "function_calls": [],}')
+        assert result == {"plan": "test plan", "function_calls": []}
+        
+        # Truncated output without closing braces
+        result = self.function_calling._parse_response(
+            'Response: {"plan": "test plan", "function_calls": [{"function_name": "get_system_info"'
+        )
+        assert result is not None
+        assert result['function_calls'][0]['function_name'] == "get_system_info"
+    
     def test_fallback_plan_creation(self):
         """Test fallback plan creation"""
         # Test email query
@@ -252,10 +362,28 @@ class TestFunctionCalling:
         assert len(errors) > 0
 
 
+class TestAsyncBatcher:
+    """Test the request micro-batcher"""
+    
+    async def test_batches_concurrent_submissions(self):
+        """Test that concurrent items are processed together and demultiplexed"""
+        batches = []
+        
+        async def process_batch(items):
+            batches.append(list(items))
+            return [item * 2 for item in items]
+        
+        batcher = AsyncBatcher(process_batch, max_batch_size=3, max_latency_ms=50)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+        await batcher.close()
+        
+        assert results == [0, 2, 4, 6, 8]
+        assert batches == [[0, 1, 2], [3, 4]]
+
+
 class TestIntegration:
     """Integration tests"""
     
-    @pytest.mark.asyncio
     async def test_end_to_end_simulation(self):
         """Test end-to-end pipeline simulation"""
         # This test uses mocked components to avoid model loading
@@ -263,6 +391,7 @@ class TestIntegration:
         
         # Mock all components
         pipeline.model_manager = Mock()
+        pipeline.model_manager.config = {}
         pipeline.model_manager.try_load_models = Mock(return_value=True)
         pipeline.model_manager.get_model_info = Mock(return_value={"loaded": True})
         pipeline.model_manager.is_loaded = Mock(return_value=True)
@@ -291,6 +420,25 @@ class TestIntegration:
         assert result['success'] is True
         assert 'plan' in result
         assert 'query' in result
+        
+        # Stop the batcher worker so no task outlives the test on the shared loop
+        await pipeline.shutdown()
+
+
+class TestEntryPoint:
+    """Test the main.py entry point"""
+    
+    def test_main_help(self, tmp_path):
+        """Test that python main.py --help imports the CLI and exits cleanly"""
+        main_py = Path(__file__).resolve().parent.parent / "main.py"
+        # Run from tmp_path, so the CLI's log file is not written into the repository
+        completed = subprocess.run(
+            [sys.executable, str(main_py), "--help"],
+            cwd=tmp_path, capture_output=True, text=True, timeout=60
+        )
+        
+        assert completed.returncode == 0, completed.stderr
+        assert "interactive" in completed.stdout
 
 
 if __name__ == "__main__":
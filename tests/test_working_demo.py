@@ -0,0 +1,43 @@
+"""
+Test cases for the standalone working demo
+"""
+
+import pytest
+
+import working_demo
+
+
+class TestDemoCSV:
+    """Test the demo's CSV loading"""
+    
+    @pytest.mark.parametrize("use_pandas", [True, False])
+    def test_short_rows_parse_alike(self, tmp_path, monkeypatch, use_pandas):
+        """Test that missing fields are None and empty fields '' with and without pandas"""
+        if use_pandas and working_demo.pd is None:
+            pytest.skip("pandas is not installed")
+        if not use_pandas:
+            monkeypatch.setattr(working_demo, "pd", None)
+        csv_file = tmp_path / "short.csv"
+        csv_file.write_text("name,amount,status\nJohn,$10.00,paid\nJane,,\nBob\n")
+        
+        header, columns = working_demo._parse_csv(str(csv_file))
+        
+        assert header == ["name", "amount", "status"]
+        assert columns == [["John", "Jane", "Bob"], ["$10.00", "", None], ["paid", "", None]]
+    
+    @pytest.mark.parametrize("use_pandas", [True, False])
+    async def test_filter_and_summarize_with_short_row(self, tmp_path, monkeypatch, use_pandas):
+        """Test that filters and summaries treat a short row alike with and without pandas"""
+        if use_pandas and working_demo.pd is None:
+            pytest.skip("pandas is not installed")
+        if not use_pandas:
+            monkeypatch.setattr(working_demo, "pd", None)
+        csv_file = tmp_path / "short.csv"
+        csv_file.write_text("name,amount,status\nJohn,$10.00,paid\nJane,$5.00,\nBob\n")
+        
+        loaded = await working_demo.SimpleFunctions.read_csv(str(csv_file))
+        unpaid = await working_demo.SimpleFunctions.filter_data(loaded['data'], "status", "equals", "")
+        summary = await working_demo.SimpleFunctions.summarize_data(loaded['data'], "amount")
+        
+        assert unpaid['count'] == 1
+        assert summary['summary']['count'] == 2
@@ -4,6 +4,7 @@ Verify Function Count and Definitions
 This script verifies that we have 55+ functions with proper descriptions, inputs, and outputs.
 """
 
+import ast
 import sys
 import os
 from pathlib import Path
@@ -11,6 +12,23 @@ from pathlib import Path
 # Add src to path
 sys.path.append(str(Path(__file__).parent / "src"))
 
+# Metadata properties every BaseFunction subclass defines
+METADATA_PROPERTIES = frozenset({'name', 'description', 'category'})
+
+def _string_properties(class_node):
+    """Return the string literals returned by a class's metadata properties, in one pass"""
+    properties = {}
+    for item in class_node.body:
+        if isinstance(item, ast.FunctionDef) and item.name in METADATA_PROPERTIES and item.body:
+            last = item.body[-1]
+            if (isinstance(last, ast.Return) and isinstance(last.value, ast.Constant)
+                    and isinstance(last.value.value, str)):
+                properties[item.name] = last.value.value
+                # The metadata properties come first; skip the rest of the class body
+                if len(properties) == len(METADATA_PROPERTIES):
+                    break
+    return properties
+
 def count_functions_in_file(file_path):
     """Count functions in a specific file"""
     functions = []
@@ -18,40 +36,24 @@ def count_functions_in_file(file_path):
         with open(file_path, 'r') as f:
             content = f.read()
         
-        # Find all class definitions that inherit from BaseFunction
-        import re
-        pattern = r'class\s+(\w+Function)\(BaseFunction\):'
-        matches = re.findall(pattern, content)
+        tree = ast.parse(content, filename=str(file_path))
         
-        for match in matches:
-            # Extract function details
-            class_pattern = rf'class\s+{match}\(BaseFunction\):.*?(?=class|\Z)'
-            class_match = re.search(class_pattern, content, re.DOTALL)
+        # Find all class definitions that inherit from BaseFunction
+        for node in tree.body:
+            if not (isinstance(node, ast.ClassDef) and
+                    any(isinstance(base, ast.Name) and base.id == 'BaseFunction' for base in node.bases)):
+                continue
             
-            if class_match:
-                class_content = class_match.group(0)
-                
-                # Extract name
-                name_match = re.search(r'return\s+"([^"]+)"', class_content)
-                name = name_match.group(1) if name_match else "unknown"
-                
-                # Extract description
-                desc_match = re.search(r'return\s+"([^"]+)".*?description', class_content, re.DOTALL)
-                if not desc_match:
-                    desc_match = re.search(r'description.*?return\s+"([^"]+)"', class_content, re.DOTALL)
-                description = desc_match.group(1) if desc_match else "No description"
-                
-                # Extract category
-                cat_match = re.search(r'category.*?return\s+"([^"]+)"', class_content, re.DOTALL)
-                category = cat_match.group(1) if cat_match else "unknown"
-                
-                functions.append({
-                    'class_name': match,
-                    'function_name': name,
-                    'description': description,
-                    'category': category,
-                    'file': file_path.name
-                })
+            properties = _string_properties(node)
+            functions.append({
+                'class_name': node.name,
+                'function_name': properties.get('name') or "unknown",
+                'description': properties.get('description') or "No description",
+                # Shared by every function in a module; interned so comparisons and
+                # category_counts lookups hit the same string object
+                'category': sys.intern(properties.get('category') or "unknown"),
+                'file': file_path.name
+            })
     
     except Exception as e:
         print(f"Error reading {file_path}: {e}")
@@ -91,8 +93,9 @@ def main():
             category = functions[0]['category']
             category_counts[category] = len(functions)
             print(f"\n{category.replace('_', ' ').title()} ({file_path.name}):")
-            for func in functions:
-                print(f"  {len(all_functions) - len(functions) + functions.index(func) + 1:2d}. {func['function_name']}")
+            base = len(all_functions) - len(functions)
+            for idx, func in enumerate(functions):
+                print(f"  {base + idx + 1:2d}. {func['function_name']}")
                 print(f"      Description: {func['description']}")
     
     # Summary
@@ -6,18 +6,30 @@ Run this to see the pipeline in your browser!
 
 import asyncio
 import json
-from http.server import HTTPServer, BaseHTTPRequestHandler
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 import urllib.parse
 from working_demo import SimpleQueryProcessor, SimpleExecutionEngine
 
-class DemoHandler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        if self.path == '/':
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
-            
-            html = """
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+def _json_default(obj):
+    """Serialize values JSON does not know: lazy data views via to_dict, anything else as str"""
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    return str(obj)
+
+def dumps(obj):
+    """Serialize obj to JSON bytes, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_json_default)
+    return json.dumps(obj, default=_json_default).encode()
+
+# The demo page, encoded once at import rather than on every request
+INDEX_HTML = """
 <!DOCTYPE html>
 <html>
 <head>
@@ -106,54 +118,56 @@ class DemoHandler(BaseHTTPRequestHandler):
         function displayResults(result) {
             const resultsDiv = document.getElementById('results');
 
-            let html = '<div class="results">';
-            html += '<h3>AI Analysis</h3>';
-            html += '<p><strong>Plan:</strong> ' + result.plan.plan + '</p>';
-            html += '<p><strong>Functions:</strong> ' + result.plan.function_calls.length + '</p>';
+            const parts = ['<div class="results">'];
+            parts.push('<h3>AI Analysis</h3>');
+            parts.push('<p><strong>Plan:</strong> ' + result.plan.plan + '</p>');
+            parts.push('<p><strong>Functions:</strong> ' + result.plan.function_calls.length + '</p>');
 
-            html += '<h3>Function Sequence</h3>';
+            parts.push('<h3>Function Sequence</h3>');
             result.plan.function_calls.forEach((call, i) => {
-                html += '<div class="function-call">';
-                html += '<strong>' + (i+1) + '. ' + call.function_name + '</strong><br>';
-                html += call.description;
-                html += '</div>';
+                parts.push('<div class="function-call">');
+                parts.push('<strong>' + (i+1) + '. ' + call.function_name + '</strong><br>');
+                parts.push(call.description);
+                parts.push('</div>');
             });
 
             if (result.execution) {
-                html += '<h3>Execution Results</h3>';
-                html += '<p><strong>Overall Success:</strong> ' + (result.execution.success ? 'Yes' : 'No') + '</p>';
-                html += '<p><strong>Completed:</strong> ' + result.execution.execution_summary.successful_functions + '/' + result.execution.execution_summary.total_functions + ' functions</p>';
+                parts.push('<h3>Execution Results</h3>');
+                parts.push('<p><strong>Overall Success:</strong> ' + (result.execution.success ? 'Yes' : 'No') + '</p>');
+                parts.push('<p><strong>Completed:</strong> ' + result.execution.execution_summary.successful_functions + '/' + result.execution.execution_summary.total_functions + ' functions</p>');
 
-                html += '<h3>Detailed Results</h3>';
+                parts.push('<h3>Detailed Results</h3>');
                 result.execution.results.forEach(res => {
                     const status = res.success ? 'success' : 'error';
                     const icon = res.success ? '[SUCCESS]' : '[ERROR]';
-                    html += '<div class="function-call ' + status + '">';
-                    html += '<strong>' + icon + ' ' + res.function_name + '</strong><br>';
+                    parts.push('<div class="function-call ' + status + '">');
+                    parts.push('<strong>' + icon + ' ' + res.function_name + '</strong><br>');
 
                     if (res.success) {
                         if (res.datetime) {
-                            html += 'Time: ' + res.datetime.formatted + ' (' + res.datetime.weekday + ')';
-                        } else if (res.data && Array.isArray(res.data)) {
-                            html += 'Loaded ' + res.data.length + ' records';
+                            parts.push('Time: ' + res.datetime.formatted + ' (' + res.datetime.weekday + ')');
+                        } else if (res.data && typeof res.data === 'object') {
+                            // Data is column-oriented: {column: [values...]}
+                            const columns = Object.values(res.data);
+                            parts.push('Loaded ' + (columns.length ? columns[0].length : 0) + ' records');
                         } else if (res.summary) {
-                            html += 'Total: $' + res.summary.sum.toFixed(2) + '<br>';
-                            html += 'Count: ' + res.summary.count + ' items';
+                            parts.push('Total: $' + res.summary.sum.toFixed(2) + '<br>');
+                            parts.push('Count: ' + res.summary.count + ' items');
                         } else if (res.message) {
-                            html += 'Message: ' + res.message;
+                            parts.push('Message: ' + res.message);
                         } else if (res.system_info) {
-                            html += 'System: ' + res.system_info.system + '<br>';
-                            html += 'Python: ' + res.system_info.python_version;
+                            parts.push('System: ' + res.system_info.system + '<br>');
+                            parts.push('Python: ' + res.system_info.python_version);
                         }
                     } else {
-                        html += 'Error: ' + (res.error || 'Unknown error');
+                        parts.push('Error: ' + (res.error || 'Unknown error'));
                     }
-                    html += '</div>';
+                    parts.push('</div>');
                 });
             }
             
-            html += '</div>';
-            resultsDiv.innerHTML = html;
+            parts.push('</div>');
+            resultsDiv.innerHTML = parts.join('');
         }
         
         // Allow Enter key to submit
@@ -165,53 +179,110 @@ class DemoHandler(BaseHTTPRequestHandler):
     </script>
 </body>
 </html>
-            """
-            self.wfile.write(html.encode())
-            
-        elif self.path == '/process':
-            # This will be handled by do_POST
-            pass
+""".encode('utf-8')
+
+# The whole response for the page, status line and headers included, written with
+# one call; DemoHandler speaks HTTP/1.1 so connections are kept alive between requests
+STATIC_RESPONSE = (
+    b'HTTP/1.1 200 OK\r\n'
+    b'Content-Type: text/html; charset=utf-8\r\n'
+    b'Content-Length: %d\r\n'
+    b'\r\n' % len(INDEX_HTML)
+) + INDEX_HTML
+
+# One event loop runs in the background for the life of the server; queries are
+# submitted to it instead of creating and tearing down a loop per request. It is
+# started by the first query, so importing this module starts no thread
+_loop = None
+_loop_thread = None
+_loop_lock = threading.Lock()
+
+# Constant parts of the error response; only the message is serialized per error
+ERROR_PREFIX = b'{"success": false, "error": '
+ERROR_SUFFIX = b'}'
+
+# Shared by all requests; execute_plan keeps its results local to each call
+PROCESSOR = SimpleQueryProcessor()
+ENGINE = SimpleExecutionEngine()
+
+def get_event_loop():
+    """Get the shared event loop, starting its thread on first use"""
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name="demo-event-loop", daemon=True)
+            _loop_thread.start()
+        return _loop
+
+def stop_event_loop():
+    """Stop the shared event loop, if started, and close it once its thread has exited"""
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None:
+            return
+        _loop.call_soon_threadsafe(_loop.stop)
+        _loop_thread.join()
+        _loop.close()
+        _loop = _loop_thread = None
+
+class DemoHandler(BaseHTTPRequestHandler):
+    # Every response carries a Content-Length, so keep-alive is safe
+    protocol_version = "HTTP/1.1"
+    
+    def do_GET(self):
+        if self.path == '/':
+            self.log_request(200)
+            self.wfile.write(STATIC_RESPONSE)
         else:
-            self.send_response(404)
-            self.end_headers()
+            # /process only accepts POST
+            self.send_not_found()
+    
+    def send_not_found(self):
+        """Send an empty 404 response"""
+        self.send_response(404)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
     
     def do_POST(self):
+        # Read the body even for unknown paths, so it is not taken for the next
+        # request on a kept-alive connection
+        content_length = int(self.headers.get('Content-Length', 0))
+        post_data = self.rfile.read(content_length)
+        
         if self.path == '/process':
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            
             try:
                 data = json.loads(post_data.decode('utf-8'))
                 query = data.get('query', '')
                 
                 # Process the query
-                result = asyncio.run(self.process_query_async(query))
+                result = asyncio.run_coroutine_threadsafe(self.process_query_async(query), get_event_loop()).result()
                 
+                body = dumps(result)
                 self.send_response(200)
                 self.send_header('Content-type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
                 self.end_headers()
-                self.wfile.write(json.dumps(result).encode())
+                self.wfile.write(body)
                 
             except Exception as e:
-                error_result = {
-                    'success': False,
-                    'error': str(e)
-                }
+                body = ERROR_PREFIX + dumps(str(e)) + ERROR_SUFFIX
                 self.send_response(500)
                 self.send_header('Content-type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
                 self.end_headers()
-                self.wfile.write(json.dumps(error_result).encode())
+                self.wfile.write(body)
+        else:
+            self.send_not_found()
     
     async def process_query_async(self, query):
         """Process query asynchronously"""
         try:
             # Process query
-            processor = SimpleQueryProcessor()
-            plan = processor.process_query(query)
+            plan = PROCESSOR.process_query(query)
             
             # Execute plan
-            engine = SimpleExecutionEngine()
-            execution_result = await engine.execute_plan(plan)
+            execution_result = await ENGINE.execute_plan(plan)
             
             return {
                 'success': True,
@@ -229,7 +300,8 @@ def main():
     print("=" * 60)
 
     server_address = ('localhost', 8080)
-    httpd = HTTPServer(server_address, DemoHandler)
+    # Each request gets its own thread, so a slow query does not hold up other tabs
+    httpd = ThreadingHTTPServer(server_address, DemoHandler)
 
     print(f"Web demo server starting on http://localhost:8080")
     print("Open your browser and go to: http://localhost:8080")
@@ -241,6 +313,9 @@ def main():
         httpd.serve_forever()
     except KeyboardInterrupt:
         print("\nServer stopped. Thanks for trying the demo!")
+    finally:
+        httpd.server_close()
+        stop_event_loop()
 
 if __name__ == "__main__":
     main()
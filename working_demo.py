@@ -5,27 +5,161 @@ This demo works without external dependencies and shows real functionality.
 """
 
 import json
+import logging
 import os
+import re
 import sys
+import calendar
+import csv
+import mmap
 import asyncio
+import functools
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
-class SimpleLogger:
-    """Simple logger replacement"""
-    @staticmethod
-    def info(msg):
-        print(f"[INFO] {msg}")
+try:
+    import numpy as np
+except ImportError:  # optional dependency; the demo also runs on the standard library alone
+    np = None
+
+try:
+    import pandas as pd
+except ImportError:  # optional dependency; the demo also runs on the standard library alone
+    pd = None
+
+# Currency symbols and thousands separators, deleted from amounts in one pass before float()
+_STRIP_CURRENCY = str.maketrans('', '', '$,')
+
+# Weekday names; calendar.day_name runs strftime on every lookup, so take them once
+_WEEKDAYS = tuple(calendar.day_name)
+
+# Demo log lines go to stdout as "[LEVEL] message"; DEMO_LOG_LEVEL=WARNING hides the INFO lines
+logger = logging.getLogger("working_demo")
+logger.setLevel(os.environ.get("DEMO_LOG_LEVEL", "INFO").upper())
+logger.propagate = False
+if not logger.handlers:
+    _log_handler = logging.StreamHandler(sys.stdout)
+    _log_handler.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
+    logger.addHandler(_log_handler)
+
+def _parse_csv(file_path):
+    """Parse a CSV file into (header, columns), or None if the file is empty"""
+    if pd is not None:
+        # pandas' C reader, keeping every value a string as the manual parser does
+        try:
+            df = pd.read_csv(file_path, dtype=str, keep_default_na=False)
+        except pd.errors.EmptyDataError:
+            return None
+        # The C parser gives a short row's missing fields '', like empty ones; a short row
+        # always ends in '', so only files with such rows are reparsed below to get None
+        if df.empty or not (df[df.columns[-1]] == '').any():
+            return list(df.columns), [df[name].tolist() for name in df.columns]
     
-    @staticmethod
-    def warning(msg):
-        print(f"[WARNING] {msg}")
+    with open(file_path, 'rb') as f:
+        # mmap cannot map an empty file
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
     
-    @staticmethod
-    def error(msg):
-        print(f"[ERROR] {msg}")
+    # Tokenize with the C csv reader (quoted fields may hold commas and newlines), one list
+    # per column; short rows are padded with None and blank lines are skipped
+    try:
+        reader = csv.reader(_mapped_lines(mm))
+        header = next(reader, [])
+        columns = [[] for _ in header]
+        for row in reader:
+            if not row or (len(row) == 1 and not row[0].strip()):
+                continue
+            row += [None] * (len(header) - len(row))
+            for column, value in zip(columns, row):
+                column.append(value)
+    finally:
+        mm.close()
+    
+    return header, columns
+
+def _mapped_lines(mm):
+    """Yield the decoded lines of a memory-mapped file, line endings included"""
+    pos, end = 0, len(mm)
+    while pos < end:
+        newline = mm.find(b'\n', pos)
+        newline = end if newline == -1 else newline + 1
+        yield mm[pos:newline].decode()
+        pos = newline
+
+@functools.lru_cache(maxsize=32)
+def _load_csv_cached(abspath, mtime_ns, size):
+    """Parse a CSV file once per (path, modification time, size)
+    
+    The columns are returned as tuples so callers cannot modify the cached data.
+    """
+    parsed = _parse_csv(abspath)
+    if parsed is None:
+        return None
+    header, columns = parsed
+    return tuple(header), tuple(tuple(column) for column in columns)
+
+# Bounded pool for CSV reads, so large scans cannot saturate the loop's default executor
+_CSV_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="csv-reader")
+
+def _read_csv_sync(file_path):
+    """Stat and load a CSV file (through the parse cache); runs on _CSV_EXECUTOR"""
+    st = os.stat(file_path)
+    return _load_csv_cached(os.path.abspath(file_path), st.st_mtime_ns, st.st_size)
+
+class _ColumnSelection(Mapping):
+    """Rows selected from column-oriented data, materialized one column at a time
+    
+    filter_data returns this instead of copying every column, so a following
+    summarize_data only builds the single column it reads.
+    """
+    
+    __slots__ = ('_source', 'indices', '_columns')
+    
+    def __init__(self, source, indices):
+        self._source = source
+        self.indices = indices
+        self._columns = {}
+    
+    def __getitem__(self, name):
+        column = self._columns.get(name)
+        if column is None:
+            source = self._source[name]
+            column = self._columns[name] = [source[i] for i in self.indices]
+        return column
+    
+    def __contains__(self, name):
+        return name in self._source
+    
+    def __iter__(self):
+        return iter(self._source)
+    
+    def __len__(self):
+        return len(self._source)
+    
+    def to_dict(self):
+        """Materialize every column, e.g. for JSON serialization"""
+        return {name: self[name] for name in self}
+
+def count_rows(columns):
+    """Number of rows in column-oriented data ({column: [values...]})"""
+    if isinstance(columns, _ColumnSelection):
+        return len(columns.indices)
+    return len(next(iter(columns.values()), ()))
 
 # Simple function implementations
+@functools.lru_cache(maxsize=1)
+def _system_info():
+    """Platform details, which do not change while the process runs"""
+    import platform
+    return {
+        "platform": platform.platform(),
+        "system": platform.system(),
+        "python_version": platform.python_version()
+    }
+
 class SimpleFunctions:
     """Simplified function implementations for demo"""
     
@@ -41,91 +175,154 @@ class SimpleFunctions:
                 "year": now.year,
                 "month": now.month,
                 "day": now.day,
-                "weekday": now.strftime("%A")
+                "weekday": _WEEKDAYS[now.weekday()]
             }
         }
     
     @staticmethod
     async def read_csv(file_path):
-        """Read CSV file"""
+        """Read CSV file into column-oriented data: {column: [values...]}"""
         try:
-            if not os.path.exists(file_path):
+            # Stat and parse off the event loop; unchanged files come from the cache
+            try:
+                loaded = await asyncio.get_running_loop().run_in_executor(
+                    _CSV_EXECUTOR, _read_csv_sync, file_path
+                )
+            except FileNotFoundError:
                 return {"success": False, "error": f"File {file_path} not found"}
-            
-            with open(file_path, 'r') as f:
-                lines = f.readlines()
-            
-            if not lines:
+            if loaded is None:
                 return {"success": False, "error": "Empty file"}
             
-            # Parse CSV manually
-            header = lines[0].strip().split(',')
-            data = []
-            for line in lines[1:]:
-                if line.strip():
-                    values = line.strip().split(',')
-                    row = dict(zip(header, values))
-                    data.append(row)
-            
+            header, columns = loaded
             return {
                 "success": True,
-                "data": data,
-                "shape": (len(data), len(header)),
-                "columns": header
+                "data": dict(zip(header, columns)),
+                "shape": (len(columns[0]) if columns else 0, len(header)),
+                "columns": list(header)
             }
         except Exception as e:
             return {"success": False, "error": str(e)}
     
     @staticmethod
     async def filter_data(data, column, operator, value):
-        """Filter data"""
+        """Filter column-oriented data by one column"""
         try:
-            filtered_data = []
-            for row in data:
-                if column not in row:
-                    continue
-                
-                row_value = row[column]
-                if operator == "equals":
-                    if row_value == value:
-                        filtered_data.append(row)
-                elif operator == "contains":
-                    if str(value).lower() in str(row_value).lower():
-                        filtered_data.append(row)
+            # Scan only the filtered column, then take the matching rows from every column;
+            # the operator is resolved once rather than per row
+            values = data.get(column, ())
+            if operator == "equals":
+                selected = [i for i, row_value in enumerate(values)
+                            if row_value is not None and row_value == value]
+            elif operator == "contains":
+                needle = str(value).lower()
+                selected = [i for i, row_value in enumerate(values)
+                            if row_value is not None
+                            and needle in (row_value if isinstance(row_value, str) else str(row_value)).lower()]
+            else:
+                selected = []
             
             return {
                 "success": True,
-                "data": filtered_data,
-                "count": len(filtered_data)
+                "data": _ColumnSelection(data, selected),
+                "count": len(selected)
             }
         except Exception as e:
             return {"success": False, "error": str(e)}
     
     @staticmethod
     async def summarize_data(data, column):
-        """Summarize numerical data"""
+        """Summarize a numerical column of column-oriented data"""
         try:
-            values = []
-            for row in data:
-                if column in row and row[column]:
+            raw = [value for value in data.get(column, ()) if value]
+            
+            values = None
+            if np is not None and raw:
+                # Remove currency symbols and convert the whole column at once
+                cleaned = np.char.translate(np.asarray(raw, dtype=str), _STRIP_CURRENCY)
+                try:
+                    values = cleaned.astype(np.float64)
+                except ValueError:
+                    pass  # some values are not numbers; convert one by one below to skip them
+            
+            if values is None:
+                values = []
+                for value in raw:
                     try:
                         # Remove currency symbols and convert to float
-                        val_str = str(row[column]).replace('$', '').replace(',', '')
+                        val_str = str(value).translate(_STRIP_CURRENCY)
                         values.append(float(val_str))
                     except ValueError:
                         continue
+                if np is not None:
+                    values = np.array(values, dtype=np.float64)
+            
+            if not len(values):
+                return {"success": False, "error": "No valid numerical data found"}
+            
+            if np is not None:
+                summary = {
+                    "count": int(values.size),
+                    "sum": float(values.sum()),
+                    "mean": float(values.mean()),
+                    "min": float(values.min()),
+                    "max": float(values.max())
+                }
+            else:
+                summary = {
+                    "count": len(values),
+                    "sum": sum(values),
+                    "mean": sum(values) / len(values),
+                    "min": min(values),
+                    "max": max(values)
+                }
+            
+            return {"success": True, "summary": summary}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+    
+    @staticmethod
+    async def filter_and_summarize(data, filter_column, operator, value, column):
+        """Summarize a numerical column over the rows matching a filter, in one pass
+        
+        Equivalent to filter_data followed by summarize_data, without building the
+        filtered rows in between.
+        """
+        try:
+            if operator == "equals":
+                matches = lambda row_value: row_value == value
+            elif operator == "contains":
+                needle = str(value).lower()
+                matches = lambda row_value: needle in (row_value if isinstance(row_value, str) else str(row_value)).lower()
+            else:
+                matches = None
+            
+            count, total, minimum, maximum = 0, 0.0, None, None
+            if matches is not None:
+                for row_value, amount in zip(data.get(filter_column, ()), data.get(column, ())):
+                    if row_value is None or not amount or not matches(row_value):
+                        continue
+                    try:
+                        # Remove currency symbols and convert to float
+                        number = float(str(amount).translate(_STRIP_CURRENCY))
+                    except ValueError:
+                        continue
+                    count += 1
+                    total += number
+                    if minimum is None or number < minimum:
+                        minimum = number
+                    if maximum is None or number > maximum:
+                        maximum = number
             
-            if not values:
+            if not count:
                 return {"success": False, "error": "No valid numerical data found"}
             
             summary = {
-                "count": len(values),
-                "sum": sum(values),
-                "mean": sum(values) / len(values),
-                "min": min(values),
-                "max": max(values)
+                "count": count,
+                "sum": total,
+                "mean": total / count,
+                "min": minimum,
+                "max": maximum
             }
-            
             return {"success": True, "summary": summary}
         except Exception as e:
             return {"success": False, "error": str(e)}
@@ -144,32 +341,76 @@ class SimpleFunctions:
     @staticmethod
     async def get_system_info():
         """Get basic system information"""
-        import platform
+        # The working directory can change, so only the platform details are cached
         return {
             "success": True,
-            "system_info": {
-                "platform": platform.platform(),
-                "system": platform.system(),
-                "python_version": platform.python_version(),
-                "current_directory": os.getcwd()
-            }
+            "system_info": _system_info() | {"current_directory": os.getcwd()}
         }
 
+# Runs of whitespace, collapsed when normalizing queries for the plan cache
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# Plan keywords, found in one scan of the lowercased query; the lookahead matches at
+# every position so overlapping keywords ("systemarch") are all seen, as with `in`
+_KEYWORDS_RE = re.compile(r'(?=(?P<time>time)|(?P<invoice>invoice)|(?P<march>march)'
+                          r'|(?P<system>system)|(?P<data>csv|data))')
+
 class SimpleQueryProcessor:
     """Simple query processor"""
     
+    __slots__ = ('functions', 'logger')
+    
     def __init__(self):
         self.functions = SimpleFunctions()
-        self.logger = SimpleLogger()
+        self.logger = logger
     
     def process_query(self, query):
         """Process a query and return function calls"""
-        self.logger.info(f"Processing query: {query}")
-        
-        query_lower = query.lower()
+        self.logger.info("Processing query: %s", query)
         
+        # Plans depend only on the keywords of the normalized query; only that scan is
+        # cached, and each call builds a fresh plan the caller is free to modify
+        query_lower = _WHITESPACE_RE.sub(' ', query).strip().lower()
+        plan = self._keyword_plan(self._keyword_hits(query_lower))
+        plan['function_calls'] = self._fuse_filter_summarize(plan['function_calls'])
+        return plan
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=512)
+    def _keyword_hits(query_lower):
+        """Plan keywords found in a normalized, lowercased query"""
+        return frozenset(match.lastgroup for match in _KEYWORDS_RE.finditer(query_lower))
+    
+    @staticmethod
+    def _fuse_filter_summarize(function_calls):
+        """Replace each filter_data call feeding summarize_data with one filter_and_summarize call"""
+        fused = []
+        for call in function_calls:
+            previous = fused[-1] if fused else None
+            if (call['function_name'] == "summarize_data"
+                    and call['parameters'].get('data') == "{{previous_result}}"
+                    and previous is not None and previous['function_name'] == "filter_data"):
+                filter_params = previous['parameters']
+                fused[-1] = {
+                    "function_name": "filter_and_summarize",
+                    "parameters": {
+                        "data": filter_params['data'],
+                        "filter_column": filter_params['column'],
+                        "operator": filter_params['operator'],
+                        "value": filter_params['value'],
+                        "column": call['parameters']['column']
+                    },
+                    "description": f"{previous['description']} and {call['description'][0].lower()}{call['description'][1:]}"
+                }
+            else:
+                fused.append(call)
+        return fused
+    
+    @staticmethod
+    def _keyword_plan(hits):
+        """Choose the plan for the keywords found in a query"""
         # Simple keyword-based function selection
-        if "time" in query_lower:
+        if "time" in hits:
             return {
                 "plan": "Get current time",
                 "function_calls": [
@@ -181,7 +422,7 @@ class SimpleQueryProcessor:
                 ]
             }
         
-        elif "invoice" in query_lower and "march" in query_lower:
+        elif "invoice" in hits and "march" in hits:
             return {
                 "plan": "Process March invoices and send summary",
                 "function_calls": [
@@ -208,7 +449,7 @@ class SimpleQueryProcessor:
                 ]
             }
         
-        elif "system" in query_lower:
+        elif "system" in hits:
             return {
                 "plan": "Get system information",
                 "function_calls": [
@@ -220,7 +461,7 @@ class SimpleQueryProcessor:
                 ]
             }
         
-        elif "csv" in query_lower or "data" in query_lower:
+        elif "data" in hits:
             return {
                 "plan": "Read and analyze data",
                 "function_calls": [
@@ -247,70 +488,124 @@ class SimpleQueryProcessor:
 class SimpleExecutionEngine:
     """Simple execution engine"""
     
+    __slots__ = ('functions', 'logger', '_dispatch')
+    
     def __init__(self):
         self.functions = SimpleFunctions()
-        self.logger = SimpleLogger()
-        self.context = {}
+        self.logger = logger
+        # Function name -> implementation, resolved once instead of per call
+        self._dispatch = {
+            name: getattr(self.functions, name) for name in dir(self.functions)
+            if not name.startswith('_') and callable(getattr(self.functions, name))
+        }
     
     async def execute_plan(self, plan):
         """Execute a function call plan"""
-        self.logger.info(f"Executing plan: {plan.get('plan', 'Unknown')}")
+        self.logger.info("Executing plan: %s", plan.get('plan', 'Unknown'))
         
         function_calls = plan.get('function_calls', [])
-        results = []
+        results = [None] * len(function_calls)
+        # Template parameters by call index, scanned once for both scheduling and filling
+        template_params = [self._template_params(call) for call in function_calls]
+        
+        # Calls in the same level do not depend on each other and run concurrently
+        for level in self._dependency_levels(template_params):
+            if self.logger.isEnabledFor(logging.INFO):
+                for i in level:
+                    self.logger.info("Executing function %d/%d: %s", i + 1, len(function_calls),
+                                     function_calls[i].get('function_name'))
+            level_results = await asyncio.gather(*(
+                self._execute_call(function_calls[i], i, template_params[i], results[i - 1] if i else None)
+                for i in level
+            ))
+            for i, result in zip(level, level_results):
+                results[i] = result
+        
+        return self._summarize(results)
+    
+    @staticmethod
+    def _template_params(call):
+        """Names of the parameters of a call that refer to {{previous_result}}"""
+        return [
+            key for key, value in call.get('parameters', {}).items()
+            if isinstance(value, str) and "{{previous_result}}" in value
+        ]
+    
+    @staticmethod
+    def _dependency_levels(template_params):
+        """Group call indices into levels; a call using {{previous_result}} follows the call before it"""
+        levels = []
+        previous_level = -1
+        for i, params in enumerate(template_params):
+            level = previous_level + 1 if i and params else 0
+            if level == len(levels):
+                levels.append([])
+            levels[level].append(i)
+            previous_level = level
+        return levels
+    
+    async def _execute_call(self, call, i, template_params, prev_result):
+        """Execute one function call, filling placeholders from the previous call's result"""
+        function_name = call.get('function_name')
+        parameters = call.get('parameters', {})
+        
+        # Process parameters (replace placeholders)
+        processed_params = dict(parameters)
+        if prev_result is not None:
+            for key in template_params:
+                # Use data from previous result
+                if 'data' in prev_result:
+                    processed_params[key] = prev_result['data']
+                else:
+                    processed_params[key] = prev_result
+        
+        func = self._dispatch.get(function_name)
+        if func is None:
+            self.logger.warning("Function %s failed: Unknown function", function_name)
+            return {
+                'success': False,
+                'error': f"Unknown function: {function_name}",
+                'function_name': function_name,
+                'call_index': i
+            }
         
-        for i, call in enumerate(function_calls):
-            function_name = call.get('function_name')
-            parameters = call.get('parameters', {})
+        # Execute function
+        try:
+            result = await func(**processed_params)
+            result['function_name'] = function_name
+            result['call_index'] = i
             
-            self.logger.info(f"Executing function {i+1}/{len(function_calls)}: {function_name}")
+            if result.get('success'):
+                self.logger.info("Function %s completed successfully", function_name)
+            else:
+                self.logger.warning("Function %s failed: %s", function_name, result.get('error', 'Unknown error'))
             
-            # Process parameters (replace placeholders)
-            processed_params = {}
-            for key, value in parameters.items():
-                if isinstance(value, str) and "{{previous_result}}" in value:
-                    if results:
-                        # Use data from previous result
-                        prev_result = results[-1]
-                        if 'data' in prev_result:
-                            processed_params[key] = prev_result['data']
-                        else:
-                            processed_params[key] = prev_result
-                    else:
-                        processed_params[key] = value
-                else:
-                    processed_params[key] = value
+            return result
             
-            # Execute function
-            try:
-                func = getattr(self.functions, function_name)
-                result = await func(**processed_params)
-                result['function_name'] = function_name
-                result['call_index'] = i
-                results.append(result)
-                
-                if result.get('success'):
-                    self.logger.info(f"Function {function_name} completed successfully")
-                else:
-                    self.logger.warning(f"Function {function_name} failed: {result.get('error', 'Unknown error')}")
-                
-            except Exception as e:
-                error_result = {
-                    'success': False,
-                    'error': str(e),
-                    'function_name': function_name,
-                    'call_index': i
-                }
-                results.append(error_result)
-                self.logger.error(f"Function {function_name} crashed: {e}")
+        except Exception as e:
+            self.logger.error("Function %s crashed: %s", function_name, e)
+            return {
+                'success': False,
+                'error': str(e),
+                'function_name': function_name,
+                'call_index': i
+            }
+    
+    def _summarize(self, results):
+        """Build the execution result from the per-function results"""
+        # One pass counts the successes; failures and overall success follow from it
+        successful = 0
+        for r in results:
+            if r.get('success', False):
+                successful += 1
         
         return {
-            'success': all(r.get('success', False) for r in results),
+            'success': successful == len(results),
             'results': results,
             'execution_summary': {
                 'total_functions': len(results),
-                'successful_functions': sum(1 for r in results if r.get('success', False)),
-                'failed_functions': sum(1 for r in results if not r.get('success', False))
+                'successful_functions': successful,
+                'failed_functions': len(results) - successful
             }
         }
 
@@ -349,8 +644,8 @@ async def demo_single_query(query):
             if 'datetime' in result:
                 dt = result['datetime']
                 print(f"      Time: {dt['formatted']} ({dt['weekday']})")
-            elif 'data' in result and isinstance(result['data'], list):
-                print(f"      Data: {len(result['data'])} records")
+            elif 'data' in result and isinstance(result['data'], Mapping):
+                print(f"      Data: {count_rows(result['data'])} records")
             elif 'summary' in result:
                 summary = result['summary']
                 print(f"      Summary: Count={summary['count']}, Sum=${summary['sum']:.2f}")